@@ -1,13 +1,21 @@
 from anthropic import AsyncAnthropic
 from openai import AsyncOpenAI
 import google.generativeai as genai
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, Callable, AsyncIterator, Tuple, Set
 import asyncio
 import json
 from datetime import datetime
 import firebase_admin
 from firebase_admin import firestore
 from config import config
+from pipeline import StageGraph
+from response_cache import ResponseCache, cache_key
+from singleflight import SingleFlight
+from rate_limiter import RateLimiter, estimate_tokens
+from retry_policy import DeadlineExceeded, RetryPolicy, deadline_scope, remaining, is_transient
+from model_health import HealthRegistry, CircuitOpenError
+from firestore_writer import firestore_writer
+from redis_store import get_redis
 import time
 
 class AIOrchestrator:
@@ -17,6 +25,14 @@ class AIOrchestrator:
         genai.configure(api_key=config.GOOGLE_API_KEY)
         self.gemini = genai.GenerativeModel('gemini-pro')
         self.db = firestore.client()
+        self.cache = ResponseCache(
+            redis_client=get_redis() if config.LLM_CACHE_REDIS else None
+        )
+        self.inflight = SingleFlight()
+        self.stragglers: Set[asyncio.Task] = set()
+        self.limiter = RateLimiter()
+        self.retry_policy = RetryPolicy()
+        self.health = HealthRegistry()
         
         self.model_roles = {
             'architect': 'claude-3-sonnet-20240229',
@@ -26,17 +42,145 @@ class AIOrchestrator:
             'debugger': 'gpt-4-turbo-preview',
             'optimizer': 'claude-3-sonnet-20240229'
         }
+        self.model_fallbacks: Dict[str, List[str]] = config.MODEL_FALLBACKS
+    
+    async def collaborative_code_generation(self, prompt: str, user_id: str, context: dict, use_cache: bool = True,
+                                            timeout: Optional[float] = None):
+        try:
+            with deadline_scope(timeout or config.PIPELINE_DEADLINE):
+                return await self._run_collaboration(prompt, user_id, context, use_cache=use_cache)
+        except Exception as e:
+            return {'error': str(e), 'status': 'failed'}
     
-    async def collaborative_code_generation(self, prompt: str, user_id: str, context: dict):
+    async def collaborative_code_generation_stream(self, prompt: str, user_id: str, context: dict,
+                                                  use_cache: bool = True,
+                                                  timeout: Optional[float] = None) -> AsyncIterator[Dict]:
+        """
+        Same pipeline as collaborative_code_generation, but yields events as it goes:
+        'delta' for each token chunk, 'stage' when a stage finishes, then 'done' or 'error'.
+        A 'reset' means the stage failed over to another model mid-stream: drop the
+        deltas received for that stage so far, the new model starts from scratch.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        
+        async def produce():
+            try:
+                with deadline_scope(timeout or config.PIPELINE_DEADLINE):
+                    result = await self._run_collaboration(
+                        prompt, user_id, context, emit=events.put_nowait, use_cache=use_cache
+                    )
+                events.put_nowait({'type': 'done', **result})
+            except Exception as e:
+                events.put_nowait({'type': 'error', 'error': str(e), 'status': 'failed'})
+        
+        runner = asyncio.create_task(produce())
         try:
-            # Step 1: Claude designs architecture
-            architecture = await self._retry_api_call(
-                self.claude.messages.create,
-                model="claude-3-sonnet-20240229",
-                max_tokens=4000,
-                messages=[{
-                    "role": "user",
-                    "content": f"""
+            while True:
+                event = await events.get()
+                yield event
+                if event['type'] in ('done', 'error'):
+                    break
+        finally:
+            # Client went away mid-stream: stop paying for the remaining stages
+            runner.cancel()
+    
+    async def _run_collaboration(self, prompt: str, user_id: str, context: dict,
+                                 emit: Optional[Callable[[Dict], None]] = None, use_cache: bool = True) -> Dict:
+        result_ref = self.db.collection('ai_collaborations').document()
+        
+        def deltas(stage: str):
+            if emit is None:
+                return None
+            return lambda text: emit({'type': 'delta', 'stage': stage, 'text': text})
+        
+        def resets(stage: str):
+            if emit is None:
+                return None
+            return lambda: emit({'type': 'reset', 'stage': stage})
+        
+        models_used: Dict[str, str] = {}
+        
+        # Step 1: Claude designs architecture
+        async def architect(inputs):
+            text, models_used['architect'] = await self._complete_role(
+                'architect',
+                [{"role": "user", "content": self._architecture_prompt(prompt, context)}],
+                max_tokens=4000, on_delta=deltas('architect'), on_reset=resets('architect'),
+                use_cache=use_cache, validate=json.loads
+            )
+            return json.loads(text)
+        
+        # Step 2: GPT-4 generates implementation
+        async def coder(inputs):
+            text, models_used['coder'] = await self._complete_role(
+                'coder',
+                self._implementation_messages(prompt, inputs['architect']),
+                on_delta=deltas('coder'), on_reset=resets('coder'), use_cache=use_cache
+            )
+            return text
+        
+        # Step 3: Claude Opus reviews code
+        async def reviewer(inputs):
+            text, models_used['reviewer'] = await self._complete_role(
+                'reviewer',
+                [{"role": "user", "content": self._review_prompt(inputs['coder'])}],
+                max_tokens=2000, on_delta=deltas('reviewer'), on_reset=resets('reviewer'),
+                use_cache=use_cache, validate=json.loads
+            )
+            return json.loads(text)
+        
+        # Step 4: Refactor if issues found
+        async def refactor(inputs):
+            issues = inputs['reviewer'].get('issues')
+            if not issues:
+                return inputs['coder']
+            text, models_used['refactor'] = await self._complete_role(
+                'coder',
+                [{"role": "user", "content": self._refactor_prompt(inputs['coder'], issues)}],
+                on_delta=deltas('refactor'), on_reset=resets('refactor'), use_cache=use_cache
+            )
+            return text
+        
+        # Step 5: Gemini generates documentation
+        async def documenter(inputs):
+            text, models_used['documenter'] = await self._complete_role(
+                'explainer',
+                [{"role": "user", "content": self._documentation_prompt(inputs['architect'], inputs['refactor'])}],
+                use_cache=use_cache
+            )
+            return text
+        
+        # Step 6: Store in Firebase, off the critical path
+        async def persist(inputs):
+            await self._store_collaboration(
+                result_ref, user_id, prompt, inputs['architect'],
+                inputs['refactor'], inputs['reviewer'], inputs['documenter'], models_used
+            )
+        
+        graph = StageGraph()
+        graph.add('architect', architect)
+        graph.add('coder', coder, deps=['architect'])
+        graph.add('reviewer', reviewer, deps=['coder'])
+        graph.add('refactor', refactor, deps=['coder', 'reviewer'])
+        graph.add('documenter', documenter, deps=['architect', 'refactor'])
+        graph.add('persist', persist, deps=['architect', 'reviewer', 'refactor', 'documenter'], background=True)
+        
+        on_complete = None
+        if emit is not None:
+            on_complete = lambda stage, result: emit({'type': 'stage', 'stage': stage, 'result': result})
+        
+        results = await graph.run(on_complete=on_complete)
+        
+        return {
+            'architecture': results['architect'],
+            'code': results['refactor'],
+            'review': results['reviewer'],
+            'documentation': results['documenter'],
+            'collaboration_id': result_ref.id
+        }
+    
+    def _architecture_prompt(self, prompt: str, context: dict) -> str:
+        return f"""
                     Design system architecture for: {prompt}
                     
                     User context: {context}
@@ -47,21 +191,14 @@ class AIOrchestrator:
                     3. Data flow
                     4. API design
                     """
-                }]
-            )
-            
-            arch_design = json.loads(architecture.content[0].text)
-            
-            # Step 2: GPT-4 generates implementation
-            implementation = await self._retry_api_call(
-                self.openai.chat.completions.create,
-                model="gpt-4-turbo-preview",
-                messages=[{
-                    "role": "system",
-                    "content": "You are an expert Python developer."
-                }, {
-                    "role": "user",
-                    "content": f"""
+    
+    def _implementation_messages(self, prompt: str, arch_design: dict) -> List[Dict]:
+        return [{
+            "role": "system",
+            "content": "You are an expert Python developer."
+        }, {
+            "role": "user",
+            "content": f"""
                     Implement this architecture:
                     {json.dumps(arch_design, indent=2)}
                     
@@ -69,52 +206,28 @@ class AIOrchestrator:
                     
                     Generate complete, production-ready Python code.
                     """
-                }]
-            )
-            
-            code = implementation.choices[0].message.content
-            
-            # Step 3: Claude Opus reviews code
-            review = await self._retry_api_call(
-                self.claude.messages.create,
-                model="claude-3-opus-20240229",
-                max_tokens=2000,
-                messages=[{
-                    "role": "user",
-                    "content": f"""
+        }]
+    
+    def _review_prompt(self, code: str) -> str:
+        return f"""
                     Review this code for security, performance, best practices, edge cases:
                     
                     {code}
                     
                     Return JSON with issues and suggestions.
                     """
-                }]
-            )
-            
-            review_results = json.loads(review.content[0].text)
-            
-            # Step 4: Refactor if issues found
-            if review_results.get('issues'):
-                refactored = await self._retry_api_call(
-                    self.openai.chat.completions.create,
-                    model="gpt-4-turbo-preview",
-                    messages=[{
-                        "role": "user",
-                        "content": f"""
+    
+    def _refactor_prompt(self, code: str, issues) -> str:
+        return f"""
                         Refactor this code to address these issues:
-                        {json.dumps(review_results['issues'], indent=2)}
+                        {json.dumps(issues, indent=2)}
                         
                         Original code:
                         {code}
                         """
-                    }]
-                )
-                code = refactored.choices[0].message.content
-            
-            # Step 5: Gemini generates documentation
-            doc_response = await self._retry_api_call(
-                self.gemini.generate_content,
-                f"""
+    
+    def _documentation_prompt(self, arch_design: dict, code: str) -> str:
+        return f"""
                 Generate comprehensive documentation for:
                 
                 Architecture: {json.dumps(arch_design)}
@@ -122,55 +235,296 @@ class AIOrchestrator:
                 
                 Include usage examples and API reference.
                 """
+    
+    async def _store_collaboration(self, result_ref, user_id: str, prompt: str, arch_design: dict, code: str,
+                                   review_results: dict, documentation: str, models_used: Dict[str, str]):
+        await firestore_writer.set(result_ref, {
+            'user_id': user_id,
+            'prompt': prompt,
+            'architecture': arch_design,
+            'code': code,
+            'review': review_results,
+            'documentation': documentation,
+            'models_used': models_used,
+            'timestamp': firestore.SERVER_TIMESTAMP
+        })
+    
+    async def _complete(self, provider: str, model: str, messages: List[Dict], max_tokens: Optional[int] = None,
+                        response_format: Optional[Dict] = None,
+                        on_delta: Optional[Callable[[str], None]] = None, use_cache: bool = True,
+                        validate: Optional[Callable[[str], Any]] = None) -> str:
+        use_cache = use_cache and config.LLM_CACHE_ENABLED
+        key = cache_key(provider, model, messages, max_tokens, response_format)
+        
+        if use_cache:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                if on_delta is not None:
+                    on_delta(cached)
+                return cached
+        
+        streamed = False
+        
+        def forward(delta: str):
+            nonlocal streamed
+            streamed = True
+            on_delta(delta)
+        
+        async def call():
+            text = await self._call_provider(
+                provider, model, messages, max_tokens, response_format,
+                forward if on_delta is not None else None
             )
+            if validate is not None:
+                # Raises before caching, so an unparseable answer is never served again from the cache
+                validate(text)
+            if use_cache and text:
+                await self.cache.set(key, text)
+            return text
+        
+        # Identical concurrent requests share one upstream call
+        text = await self.inflight.do(key, call)
+        
+        if on_delta is not None and not streamed:
+            on_delta(text)
+        return text
+    
+    async def _call_provider(self, provider: str, model: str, messages: List[Dict], max_tokens: Optional[int] = None,
+                             response_format: Optional[Dict] = None,
+                             on_delta: Optional[Callable[[str], None]] = None) -> str:
+        tokens = estimate_tokens(messages, max_tokens)
+        
+        if on_delta is not None and provider in ('anthropic', 'openai'):
+            if not self.health.allow(model):
+                raise CircuitOpenError(f"Circuit open for {model}")
+            chunks = []
+            if provider == 'anthropic':
+                stream = self._stream_claude(model, max_tokens, messages)
+            else:
+                stream = self._stream_gpt(model, messages, response_format)
             
-            documentation = doc_response.text
-            
-            # Step 6: Store in Firebase
-            result_ref = self.db.collection('ai_collaborations').document()
-            result_ref.set({
-                'user_id': user_id,
-                'prompt': prompt,
-                'architecture': arch_design,
-                'code': code,
-                'review': review_results,
-                'documentation': documentation,
-                'models_used': list(self.model_roles.values()),
-                'timestamp': firestore.SERVER_TIMESTAMP
-            })
+            started = None
             
-            return {
-                'architecture': arch_design,
-                'code': code,
-                'review': review_results,
-                'documentation': documentation,
-                'collaboration_id': result_ref.id
-            }
+            async def consume():
+                nonlocal started
+                async with self.limiter.slot(provider, model, tokens):
+                    # Time queued in the limiter is ours, not the model's
+                    started = time.monotonic()
+                    async for delta in stream:
+                        chunks.append(delta)
+                        on_delta(delta)
             
-        except Exception as e:
-            return {'error': str(e), 'status': 'failed'}
+            try:
+                await asyncio.wait_for(consume(), remaining())
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and remaining() == 0:
+                    # The request ran out of budget; that says nothing about the model
+                    raise DeadlineExceeded("Request deadline exceeded") from None
+                if started is not None:
+                    self.health.record(model, time.monotonic() - started, ok=not is_transient(e))
+                raise
+            self.health.record(model, time.monotonic() - started, ok=True)
+            return ''.join(chunks)
+        
+        def tracked(func):
+            async def call(*args, **kwargs):
+                if not self.health.allow(model):
+                    raise CircuitOpenError(f"Circuit open for {model}")
+                async with self.limiter.slot(provider, model, tokens):
+                    started = time.monotonic()
+                    try:
+                        response = await func(*args, **kwargs)
+                    except Exception as e:
+                        # Client errors (bad request, auth) say nothing about the model's health
+                        self.health.record(model, time.monotonic() - started, ok=not is_transient(e))
+                        raise
+                    self.health.record(model, time.monotonic() - started, ok=True)
+                    return response
+            return call
+        
+        hedge_after = self.health.hedge_delay(model)
+        
+        if provider == 'anthropic':
+            kwargs = {}
+            system, messages = self._split_system(messages)
+            if system:
+                kwargs['system'] = system
+            response = await self._retry_api_call(
+                tracked(self.claude.messages.create),
+                model=model,
+                max_tokens=max_tokens or config.DEFAULT_COMPLETION_TOKENS,
+                messages=messages,
+                hedge_after=hedge_after,
+                **kwargs
+            )
+            return response.content[0].text
+        elif provider == 'openai':
+            kwargs = {}
+            if response_format:
+                kwargs['response_format'] = response_format
+            if max_tokens:
+                kwargs['max_tokens'] = max_tokens
+            response = await self._retry_api_call(
+                tracked(self.openai.chat.completions.create),
+                model=model,
+                messages=messages,
+                hedge_after=hedge_after,
+                **kwargs
+            )
+            return response.choices[0].message.content
+        elif provider == 'gemini':
+            response = await self._retry_api_call(
+                tracked(self.gemini.generate_content),
+                '\n'.join(m['content'] for m in messages),
+                hedge_after=hedge_after
+            )
+            return response.text
+        
+        raise ValueError(f"Unknown provider: {provider}")
+    
+    def route(self, role: str) -> List[str]:
+        """
+        Candidate models for a role, healthiest first. The configured primary wins
+        ties; models with an open breaker are only tried as a last resort. A
+        primary whose breaker is due a probe goes first, or a healthy fallback
+        would keep it from ever being tried again.
+        """
+        primary = self.model_roles.get(role, 'claude-3-sonnet-20240229')
+        candidates = [primary] + [m for m in self.model_fallbacks.get(role, []) if m != primary]
+        if self.health.probe_due(primary):
+            return [primary] + sorted(candidates[1:], key=self.health.rank)
+        return sorted(candidates, key=self.health.rank)
+    
+    async def _complete_role(self, role: str, messages: List[Dict],
+                             on_reset: Optional[Callable[[], None]] = None, **kwargs) -> Tuple[str, str]:
+        on_delta = kwargs.get('on_delta')
+        streamed = False
+        if on_delta is not None:
+            def forward(delta: str):
+                nonlocal streamed
+                streamed = True
+                on_delta(delta)
+            kwargs['on_delta'] = forward
+        
+        error = None
+        for model in self.route(role):
+            provider = self._provider_for(model)
+            if provider is None:
+                continue
+            try:
+                return await self._complete(provider, model, messages, **kwargs), model
+            except Exception as e:
+                if not (is_transient(e) or isinstance(e, CircuitOpenError)):
+                    raise
+                if streamed:
+                    # The listener already has part of this model's output
+                    if on_reset is None:
+                        raise
+                    on_reset()
+                    streamed = False
+                # Fail over to the next candidate for this role
+                error = e
+        raise error or ValueError(f"No usable model for role: {role}")
+    
+    def _split_system(self, messages: List[Dict]) -> Tuple[Optional[str], List[Dict]]:
+        # Anthropic takes the system prompt as a parameter rather than a message
+        system = '\n'.join(m['content'] for m in messages if m['role'] == 'system')
+        return system or None, [m for m in messages if m['role'] != 'system']
     
-    async def consensus_decision(self, question: str, options: List[str]):
-        responses = await asyncio.gather(
-            self.ask_claude(question, options),
-            self.ask_gpt(question, options),
-            self.ask_gemini(question, options),
-            return_exceptions=True
+    async def _stream_claude(self, model: str, max_tokens: int, messages: List[Dict]) -> AsyncIterator[str]:
+        kwargs = {}
+        system, messages = self._split_system(messages)
+        if system:
+            kwargs['system'] = system
+        async with self.claude.messages.stream(
+            model=model,
+            max_tokens=max_tokens or config.DEFAULT_COMPLETION_TOKENS,
+            messages=messages,
+            **kwargs
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+    
+    async def _stream_gpt(self, model: str, messages: List[Dict],
+                          response_format: Optional[Dict] = None) -> AsyncIterator[str]:
+        kwargs = {}
+        if response_format:
+            kwargs['response_format'] = response_format
+        stream = await self._retry_api_call(
+            self.openai.chat.completions.create,
+            model=model,
+            messages=messages,
+            stream=True,
+            **kwargs
         )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    async def consensus_decision(self, question: str, options: List[str], use_cache: bool = True,
+                                 timeout: Optional[float] = None, quorum: Optional[float] = None,
+                                 weights: Optional[Dict[str, float]] = None):
+        quorum = quorum if quorum is not None else config.CONSENSUS_QUORUM
+        weights = weights or config.CONSENSUS_WEIGHTS
+        key = 'consensus:' + json.dumps([question, options, use_cache, quorum, weights], sort_keys=True)
+        with deadline_scope(timeout or config.REQUEST_DEADLINE):
+            return await self.inflight.do(
+                key, lambda: self._consensus(question, options, use_cache, quorum, weights)
+            )
+    
+    async def _consensus(self, question: str, options: List[str], use_cache: bool, quorum: float,
+                         weights: Dict[str, float]):
+        askers = {
+            'claude': self.ask_claude,
+            'gpt': self.ask_gpt,
+            'gemini': self.ask_gemini
+        }
+        tasks = {
+            asyncio.create_task(ask(question, options, use_cache)): name
+            for name, ask in askers.items()
+        }
         
-        valid_responses = [r for r in responses if not isinstance(r, Exception)]
+        valid_responses = []
+        pending = set(tasks)
+        quorum_reached = False
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and isinstance(task.result(), dict):
+                        valid_responses.append({**task.result(), 'model': tasks[task]})
+                
+                # Stop as soon as enough weighted votes agree
+                if quorum and self._agreement(valid_responses, weights)[1] >= quorum:
+                    quorum_reached = True
+                    break
+        finally:
+            for task in pending:
+                if quorum_reached and config.CONSENSUS_FINISH_STRAGGLERS:
+                    # Still waited on, so its provider call finishes and lands in the response cache
+                    self.stragglers.add(task)
+                    task.add_done_callback(self._straggler_done)
+                else:
+                    task.cancel()
         
         if not valid_responses:
             return {'error': 'All AI models failed to respond'}
         
-        return await self.analyze_consensus(valid_responses)
+        # Models cut off by the quorum still count towards the total they agreed out of
+        unanswered = [tasks[task] for task in pending]
+        result = await self.analyze_consensus(valid_responses, weights, unanswered)
+        result['quorum_reached'] = quorum_reached
+        return result
     
-    async def ask_claude(self, question: str, options: List[str]):
-        response = await self._retry_api_call(
-            self.claude.messages.create,
-            model="claude-3-sonnet-20240229",
-            max_tokens=1000,
-            messages=[{
+    def _straggler_done(self, task: asyncio.Task):
+        self.stragglers.discard(task)
+        if not task.cancelled():
+            task.exception()
+    
+    async def ask_claude(self, question: str, options: List[str], use_cache: bool = True):
+        text = await self._complete(
+            'anthropic', "claude-3-sonnet-20240229",
+            [{
                 "role": "user",
                 "content": f"""
                 {question}
@@ -180,16 +534,17 @@ class AIOrchestrator:
                 Choose the best option and explain why in JSON:
                 {{"choice": "...", "reasoning": "...", "confidence": 0.0-1.0}}
                 """
-            }]
+            }],
+            max_tokens=1000,
+            use_cache=use_cache,
+            validate=json.loads
         )
-        return json.loads(response.content[0].text)
+        return json.loads(text)
     
-    async def ask_gpt(self, question: str, options: List[str]):
-        response = await self._retry_api_call(
-            self.openai.chat.completions.create,
-            model="gpt-4-turbo-preview",
-            response_format={"type": "json_object"},
-            messages=[{
+    async def ask_gpt(self, question: str, options: List[str], use_cache: bool = True):
+        text = await self._complete(
+            'openai', "gpt-4-turbo-preview",
+            [{
                 "role": "user",
                 "content": f"""
                 {question}
@@ -199,39 +554,42 @@ class AIOrchestrator:
                 Choose the best option and explain why in JSON:
                 {{"choice": "...", "reasoning": "...", "confidence": 0.0-1.0}}
                 """
-            }]
+            }],
+            response_format={"type": "json_object"},
+            use_cache=use_cache,
+            validate=json.loads
         )
-        return json.loads(response.choices[0].message.content)
+        return json.loads(text)
     
-    async def ask_gemini(self, question: str, options: List[str]):
-        response = await self._retry_api_call(
-            self.gemini.generate_content,
-            f"""
+    async def ask_gemini(self, question: str, options: List[str], use_cache: bool = True):
+        text = await self._complete(
+            'gemini', 'gemini-pro',
+            [{
+                "role": "user",
+                "content": f"""
             {question}
             
             Options: {options}
             
             Choose the best option and explain why in JSON format.
             """
+            }],
+            use_cache=use_cache,
+            validate=json.loads
         )
-        return json.loads(response.text)
+        return json.loads(text)
     
-    async def analyze_consensus(self, responses: List[Dict]):
-        choices = [r.get('choice') for r in responses if r.get('choice')]
+    async def analyze_consensus(self, responses: List[Dict], weights: Optional[Dict[str, float]] = None,
+                                unanswered: Optional[List[str]] = None):
+        consensus_choice, consensus_weight = self._agreement(responses, weights)
         
-        if not choices:
+        if consensus_choice is None:
             return {'consensus': None, 'confidence': 0.0}
         
-        # Find most common choice
-        choice_counts = {}
-        for choice in choices:
-            choice_counts[choice] = choice_counts.get(choice, 0) + 1
-        
-        consensus_choice = max(choice_counts, key=choice_counts.get)
-        consensus_count = choice_counts[consensus_choice]
-        
-        # Calculate confidence based on agreement
-        confidence = consensus_count / len(responses)
+        # Calculate confidence based on (weighted) agreement
+        total_weight = sum(self._weight(r, weights) for r in responses)
+        total_weight += sum(self._weight({'model': model}, weights) for model in unanswered or [])
+        confidence = consensus_weight / total_weight if total_weight else 0.0
         
         # Get reasoning from responses that chose consensus
         reasoning = []
@@ -246,51 +604,41 @@ class AIOrchestrator:
             'all_responses': responses
         }
     
-    async def _retry_api_call(self, func, *args, **kwargs):
-        max_retries = 3
-        base_delay = 1
+    def _agreement(self, responses: List[Dict], weights: Optional[Dict[str, float]] = None) -> Tuple[Optional[str], float]:
+        # Find the choice with the most (weighted) votes
+        choice_weights = {}
+        for r in responses:
+            choice = r.get('choice')
+            if choice:
+                choice_weights[choice] = choice_weights.get(choice, 0.0) + self._weight(r, weights)
         
-        for attempt in range(max_retries):
-            try:
-                return await func(*args, **kwargs)
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    raise e
-                
-                delay = base_delay * (2 ** attempt)
-                await asyncio.sleep(delay)
+        if not choice_weights:
+            return None, 0.0
         
-        raise Exception("Max retries exceeded")
+        consensus_choice = max(choice_weights, key=choice_weights.get)
+        return consensus_choice, choice_weights[consensus_choice]
     
-    async def specialized_task(self, task_type: str, prompt: str, user_id: str):
-        model = self.model_roles.get(task_type, 'claude-3-sonnet-20240229')
-        
-        if 'claude' in model:
-            response = await self._retry_api_call(
-                self.claude.messages.create,
-                model=model,
+    def _weight(self, response: Dict, weights: Optional[Dict[str, float]]) -> float:
+        if not weights:
+            return 1.0
+        return weights.get(response.get('model'), 1.0)
+    
+    async def _retry_api_call(self, func, *args, hedge_after: Optional[float] = None, **kwargs):
+        return await self.retry_policy.call(lambda: func(*args, **kwargs), hedge_after=hedge_after)
+    
+    async def specialized_task(self, task_type: str, prompt: str, user_id: str, use_cache: bool = True,
+                               timeout: Optional[float] = None, default_deadline: bool = True):
+        # The deadline clock includes rate-limiter queueing, so batches opt out of the default
+        with deadline_scope(timeout or (config.REQUEST_DEADLINE if default_deadline else None)):
+            result, model = await self._complete_role(
+                task_type,
+                [{"role": "user", "content": prompt}],
                 max_tokens=2000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            result = response.content[0].text
-        elif 'gpt' in model:
-            response = await self._retry_api_call(
-                self.openai.chat.completions.create,
-                model=model,
-                messages=[{"role": "user", "content": prompt}]
+                use_cache=use_cache
             )
-            result = response.choices[0].message.content
-        elif 'gemini' in model:
-            response = await self._retry_api_call(
-                self.gemini.generate_content,
-                prompt
-            )
-            result = response.text
-        else:
-            result = "Unknown model type"
         
         # Store specialized task result
-        self.db.collection('specialized_tasks').add({
+        await firestore_writer.add('specialized_tasks', {
             'user_id': user_id,
             'task_type': task_type,
             'model': model,
@@ -299,4 +647,38 @@ class AIOrchestrator:
             'timestamp': firestore.SERVER_TIMESTAMP
         })
         
-        return {'result': result, 'model': model, 'task_type': task_type}
\ No newline at end of file
+        return {'result': result, 'model': model, 'task_type': task_type}
+    
+    def _provider_for(self, model: str) -> Optional[str]:
+        if 'claude' in model:
+            return 'anthropic'
+        elif 'gpt' in model:
+            return 'openai'
+        elif 'gemini' in model:
+            return 'gemini'
+        return None
+    
+    async def get_models_status(self) -> Dict:
+        models = set(self.model_roles.values())
+        for fallbacks in self.model_fallbacks.values():
+            models.update(fallbacks)
+        
+        return {
+            'models': {model: {**self.health.stats(model).summary(), 'state': self.health.breaker(model).status()}
+                       for model in sorted(models)},
+            'roles': {role: {'primary': model, 'active': self.route(role)[0]}
+                      for role, model in self.model_roles.items()}
+        }
+    
+    def get_rate_limit_status(self) -> Dict:
+        return {
+            **self.limiter.status(),
+            'retries': self.retry_policy.stats
+        }
+    
+    def get_cache_stats(self) -> Dict:
+        return {
+            **self.cache.get_stats(),
+            'coalesced_calls': self.inflight.stats['shared'],
+            'in_flight': self.inflight.in_flight()
+        }
\ No newline at end of file
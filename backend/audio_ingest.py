@@ -0,0 +1,84 @@
+import asyncio
+from typing import Optional
+
+from config import config
+
+
+def frame_bytes(sample_rate: int = None) -> int:
+    # 16-bit mono PCM, VOICE_FRAME_MS of audio per frame
+    sample_rate = sample_rate or config.VOICE_SAMPLE_RATE
+    return sample_rate * config.VOICE_FRAME_MS // 1000 * config.VOICE_SAMPLE_WIDTH
+
+
+class AudioRingBuffer:
+    """
+    Fixed-capacity byte ring between the socket reader and the transcriber feed.
+    Whatever chunk sizes the client sends, read() hands out frames of exactly
+    frame_size bytes. write() waits while the ring is full, so a transcriber that
+    falls behind stops the socket being read rather than growing memory. After
+    close(), read() drains what is left (a short final frame included) and then
+    returns None.
+    """
+
+    def __init__(self, capacity: int = None, frame_size: int = None):
+        self.frame_size = frame_size or frame_bytes()
+        capacity = capacity or config.VOICE_BUFFER_SECONDS * 1000 // config.VOICE_FRAME_MS * self.frame_size
+        self.capacity = max(capacity, self.frame_size)
+        self._buf = bytearray(self.capacity)
+        self._start = 0
+        self._size = 0
+        self._closed = False
+        self._changed = asyncio.Event()
+        self.stats = {'bytes_in': 0, 'frames_out': 0, 'full_waits': 0}
+
+    def __len__(self) -> int:
+        return self._size
+
+    async def write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            if self._closed:
+                raise RuntimeError("Audio buffer is closed")
+            space = self.capacity - self._size
+            if not space:
+                self.stats['full_waits'] += 1
+                await self._wait()
+                continue
+            chunk, view = view[:space], view[space:]
+            end = (self._start + self._size) % self.capacity
+            first = min(len(chunk), self.capacity - end)
+            self._buf[end:end + first] = chunk[:first]
+            self._buf[:len(chunk) - first] = chunk[first:]
+            self._size += len(chunk)
+            self.stats['bytes_in'] += len(chunk)
+            self._notify()
+
+    async def read(self) -> Optional[bytes]:
+        while self._size < self.frame_size:
+            if self._closed:
+                return self._take(self._size) if self._size else None
+            await self._wait()
+        return self._take(self.frame_size)
+
+    def close(self):
+        self._closed = True
+        self._notify()
+
+    def _take(self, count: int) -> bytes:
+        end = self._start + count
+        if end <= self.capacity:
+            frame = bytes(self._buf[self._start:end])
+        else:
+            frame = bytes(self._buf[self._start:]) + bytes(self._buf[:end - self.capacity])
+        self._start = end % self.capacity
+        self._size -= count
+        self.stats['frames_out'] += 1
+        self._notify()
+        return frame
+
+    async def _wait(self):
+        await self._changed.wait()
+        self._changed.clear()
+
+    def _notify(self):
+        self._changed.set()
@@ -0,0 +1,212 @@
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Hashable, List, Optional, Tuple
+
+from config import config
+
+# Operations are {"pos": int, "insert": str} or {"pos": int, "delete": int}. A change
+# is a list of operations applied in order, each against the result of the last.
+# A client keeps at most one change in flight: it sends the next one only after its
+# previous change comes back to it (matched by opId) with a server version.
+Op = Dict
+Ops = List[Op]
+
+
+class DocumentError(Exception):
+    pass
+
+
+def apply_ops(text: str, ops: Ops) -> str:
+    for op in ops:
+        pos = op['pos']
+        if 'insert' in op:
+            if not 0 <= pos <= len(text):
+                raise DocumentError(f"Insert position {pos} out of range")
+            text = text[:pos] + op['insert'] + text[pos:]
+        else:
+            if not (0 <= pos and pos + op['delete'] <= len(text)):
+                raise DocumentError(f"Delete range {pos}+{op['delete']} out of range")
+            text = text[:pos] + text[pos + op['delete']:]
+    return text
+
+
+def transform(a: Ops, b: Ops) -> Tuple[Ops, Ops]:
+    """
+    Given concurrent changes a and b made against the same version, return
+    (a', b') such that applying b then a' gives the same text as a then b'.
+    b is the change the server applied first, so it wins insert ties.
+    """
+    if not a or not b:
+        return a, b
+    if len(a) == 1 and len(b) == 1:
+        return _transform_pair(a[0], b[0])
+    if len(a) > 1:
+        head, b = transform(a[:1], b)
+        rest, b = transform(a[1:], b)
+        return head + rest, b
+    a, head = transform(a, b[:1])
+    a, rest = transform(a, b[1:])
+    return a, head + rest
+
+
+def _transform_pair(a: Op, b: Op) -> Tuple[Ops, Ops]:
+    if 'insert' in a and 'insert' in b:
+        if b['pos'] <= a['pos']:
+            return [{**a, 'pos': a['pos'] + len(b['insert'])}], [b]
+        return [a], [{**b, 'pos': b['pos'] + len(a['insert'])}]
+    if 'insert' in a:
+        return [_insert_after_delete(a, b)], _delete_after_insert(b, a)
+    if 'insert' in b:
+        return _delete_after_insert(a, b), [_insert_after_delete(b, a)]
+    return _delete_after_delete(a, b), _delete_after_delete(b, a)
+
+
+def _insert_after_delete(ins: Op, dele: Op) -> Op:
+    start, end = dele['pos'], dele['pos'] + dele['delete']
+    if ins['pos'] <= start:
+        return ins
+    if ins['pos'] >= end:
+        return {**ins, 'pos': ins['pos'] - dele['delete']}
+    return {**ins, 'pos': start}
+
+
+def _delete_after_insert(dele: Op, ins: Op) -> Ops:
+    start, end = dele['pos'], dele['pos'] + dele['delete']
+    if ins['pos'] <= start:
+        return [{**dele, 'pos': start + len(ins['insert'])}]
+    if ins['pos'] >= end:
+        return [dele]
+    # The insert landed inside the deleted range: delete around it, keep the new text
+    before = ins['pos'] - start
+    return [
+        {'pos': start, 'delete': before},
+        {'pos': start + len(ins['insert']), 'delete': dele['delete'] - before}
+    ]
+
+
+def _delete_after_delete(a: Op, b: Op) -> Ops:
+    a_start, a_end = a['pos'], a['pos'] + a['delete']
+    b_start, b_end = b['pos'], b['pos'] + b['delete']
+    if a_end <= b_start:
+        return [a]
+    if a_start >= b_end:
+        return [{**a, 'pos': a_start - b['delete']}]
+    overlap = min(a_end, b_end) - max(a_start, b_start)
+    remaining = a['delete'] - overlap
+    return [{'pos': min(a_start, b_start), 'delete': remaining}] if remaining else []
+
+
+def validate_ops(ops) -> Ops:
+    if not isinstance(ops, list):
+        raise DocumentError("ops must be a list")
+    clean = []
+    for op in ops:
+        if not isinstance(op, dict) or not isinstance(op.get('pos'), int):
+            raise DocumentError("Each op needs an integer pos")
+        if isinstance(op.get('insert'), str):
+            clean.append({'pos': op['pos'], 'insert': op['insert']})
+        elif isinstance(op.get('delete'), int) and op['delete'] > 0:
+            clean.append({'pos': op['pos'], 'delete': op['delete']})
+        else:
+            raise DocumentError("Each op needs an insert string or a positive delete count")
+    return clean
+
+
+class TextDocument:
+    """
+    Server-authoritative text. Incoming changes name the version they were made
+    against; they are transformed over everything applied since then and given
+    the next version number. The last COLLAB_DOC_HISTORY changes are kept for
+    transforming late changes, and every COLLAB_DOC_COMPACT_EVERY changes the
+    snapshot is advanced so a joiner's tail stays short.
+
+    Changes are only rebased over other authors' changes. One that was made
+    before its author's previous change was acknowledged is rejected rather
+    than transformed over that change a second time.
+    """
+
+    def __init__(self, text: str = ''):
+        self.text = text
+        self.version = 0
+        self.snapshot = text
+        self.snapshot_version = 0
+        history = max(config.COLLAB_DOC_HISTORY, config.COLLAB_DOC_COMPACT_EVERY)
+        self.history: Deque[Tuple[int, Ops, Optional[Hashable]]] = deque(maxlen=history)
+
+    def apply(self, base_version: int, ops: Ops, author: Hashable = None) -> Tuple[int, Ops]:
+        if base_version > self.version:
+            raise DocumentError(f"Unknown version {base_version}")
+        oldest = self.history[0][0] - 1 if self.history else self.version
+        if base_version < oldest:
+            raise DocumentError(f"Version {base_version} is too old to rebase")
+
+        newer = [(applied, by) for version, applied, by in self.history if version > base_version]
+        if author is not None and any(by == author for _, by in newer):
+            raise DocumentError("Previous change not acknowledged yet: wait for its opId before sending another")
+        for applied, _ in newer:
+            ops, _ = transform(ops, applied)
+
+        self.text = apply_ops(self.text, ops)
+        self.version += 1
+        self.history.append((self.version, ops, author))
+
+        if self.version - self.snapshot_version >= config.COLLAB_DOC_COMPACT_EVERY:
+            self.snapshot = self.text
+            self.snapshot_version = self.version
+
+        return self.version, ops
+
+    def snapshot_with_tail(self) -> Dict:
+        return {
+            'version': self.snapshot_version,
+            'text': self.snapshot,
+            'tail': [
+                {'version': version, 'ops': ops}
+                for version, ops, _ in self.history if version > self.snapshot_version
+            ]
+        }
+
+
+class DocumentStore:
+    """
+    Documents per (room, file), with the least recently edited rooms evicted
+    beyond COLLAB_MAX_DOCUMENT_ROOMS to bound memory.
+    """
+
+    def __init__(self):
+        self.rooms: 'OrderedDict[str, Dict[str, TextDocument]]' = OrderedDict()
+
+    def get(self, room_id: str, file: str) -> TextDocument:
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = {}
+            while len(self.rooms) > config.COLLAB_MAX_DOCUMENT_ROOMS:
+                self.rooms.popitem(last=False)
+        self.rooms.move_to_end(room_id)
+        if file not in room:
+            room[file] = TextDocument()
+        return room[file]
+
+    def apply(self, room_id: str, message: Dict, author: Hashable = None) -> Dict:
+        file = message.get('file') or 'main'
+        base_version = message.get('version')
+        if not isinstance(base_version, int):
+            raise DocumentError("code_change needs the integer version it was made against")
+
+        version, ops = self.get(room_id, file).apply(base_version, validate_ops(message.get('ops')), author)
+        return {
+            'type': 'code_change',
+            'file': file,
+            'version': version,
+            'ops': ops,
+            'userId': message.get('userId'),
+            'opId': message.get('opId')
+        }
+
+    def snapshots(self, room_id: str) -> List[Dict]:
+        return [
+            {'type': 'doc_snapshot', 'file': file, **document.snapshot_with_tail()}
+            for file, document in self.rooms.get(room_id, {}).items()
+        ]
+
+    def snapshot(self, room_id: str, file: str) -> Dict:
+        return {'type': 'doc_snapshot', 'file': file, **self.get(room_id, file).snapshot_with_tail()}
@@ -0,0 +1,332 @@
+import asyncio
+import json
+import uuid
+from typing import Callable, Dict, List, Optional, Set, Union
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from config import config
+from redis_store import get_redis
+from wire_protocol import Frame, JsonCodec, negotiate
+
+
+class Connection:
+    """
+    One collaborator socket with its own bounded send queue and writer task, so a
+    slow client only ever delays itself. When the queue is full the oldest frame
+    is dropped (or the client is disconnected, depending on
+    COLLAB_SLOW_CONSUMER_POLICY); too many drops in a row also disconnects it.
+    """
+
+    def __init__(self, websocket: WebSocket, room_id: str, on_close: Callable[['Connection'], None], codec=None):
+        self.websocket = websocket
+        self.room_id = room_id
+        self.codec = codec or JsonCodec()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=config.COLLAB_SEND_QUEUE_SIZE)
+        self.dropped = 0
+        self.consecutive_drops = 0
+        self.closed = False
+        self._on_close = on_close
+        self._writer = asyncio.create_task(self._write())
+
+    def offer(self, frame: Frame):
+        if self.closed:
+            return
+
+        try:
+            self.queue.put_nowait(frame)
+            self.consecutive_drops = 0
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if config.COLLAB_SLOW_CONSUMER_POLICY == 'disconnect':
+            self.close(code=1013, reason="Slow consumer")
+            return
+
+        self.queue.get_nowait()
+        self.queue.put_nowait(frame)
+        self.dropped += 1
+        self.consecutive_drops += 1
+        if self.consecutive_drops > config.COLLAB_MAX_CONSECUTIVE_DROPS:
+            self.close(code=1013, reason="Slow consumer")
+
+    def close(self, code: int = 1000, reason: str = ""):
+        if self.closed:
+            return
+        self.closed = True
+        self._writer.cancel()
+        self._on_close(self)
+        asyncio.create_task(self._close_socket(code, reason))
+
+    async def _write(self):
+        try:
+            while True:
+                frame = await self.queue.get()
+                send = self.websocket.send_bytes if self.codec.binary else self.websocket.send_text
+                await asyncio.wait_for(send(frame), config.COLLAB_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Send failed or timed out: the socket is gone or hopelessly behind
+            self.close(code=1011)
+
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+
+class FrameBatcher:
+    """
+    Pending high-frequency updates for one room between ticks. Cursor moves keep
+    only the latest position per user. Canvas updates are merged per element:
+    successive updates fold into one, updates to an element created this tick
+    fold into the creation, and a delete replaces whatever was pending.
+    """
+
+    def __init__(self):
+        self.cursors: Dict[str, Dict] = {}
+        self.canvas: Dict[str, Dict] = {}
+        self.received = 0
+
+    def add_cursor(self, message: Dict):
+        self.received += 1
+        user = message.get('userId') or message.get('user_id') or str(self.received)
+        self.cursors[user] = message
+
+    def add_canvas(self, message: Dict):
+        self.received += 1
+        element_id = message.get('elementId') or (message.get('element') or {}).get('id')
+        if not element_id:
+            # Unknown shape: pass it through untouched
+            self.canvas[f"_{self.received}"] = message
+            return
+
+        pending = self.canvas.get(element_id)
+        if pending is None or message.get('action') == 'delete':
+            if pending is not None and 'element' in pending:
+                # Created and deleted within one tick: peers never need to see it
+                del self.canvas[element_id]
+            else:
+                self.canvas[element_id] = message
+        elif pending.get('action') == 'delete':
+            return
+        elif 'updates' in message and 'element' in pending:
+            pending['element'] = {**pending['element'], **message['updates']}
+        elif 'updates' in message and 'updates' in pending:
+            pending['updates'] = {**pending['updates'], **message['updates']}
+        else:
+            self.canvas[element_id] = message
+
+    def drain(self) -> List[Dict]:
+        messages = list(self.canvas.values()) + list(self.cursors.values())
+        self.cursors.clear()
+        self.canvas.clear()
+        return messages
+
+
+class LocalBroadcast:
+    """
+    Single-process backend: rooms only exist in this worker, nothing to relay.
+    """
+
+    def start(self, deliver: Callable[[str, str], None]):
+        pass
+
+    async def join(self, room_id: str):
+        pass
+
+    async def leave(self, room_id: str):
+        pass
+
+    async def publish(self, room_id: str, frame: str):
+        pass
+
+
+class RedisBroadcast:
+    """
+    Relays room frames between workers over Redis pub/sub. A worker subscribes
+    to a room's channel while it has local members in that room. Published frames
+    are tagged with the worker id so a worker skips its own messages, which it
+    has already delivered locally.
+    """
+
+    def __init__(self, redis=None):
+        self.worker_id = uuid.uuid4().hex
+        self.redis = redis or get_redis()
+        self.pubsub = self.redis.pubsub()
+        self.rooms: Set[str] = set()
+        self._deliver: Optional[Callable[[str, str], None]] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    def start(self, deliver: Callable[[str, str], None]):
+        self._deliver = deliver
+
+    async def join(self, room_id: str):
+        await self.pubsub.subscribe(self._channel(room_id))
+        self.rooms.add(room_id)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+
+    async def leave(self, room_id: str):
+        self.rooms.discard(room_id)
+        await self.pubsub.unsubscribe(self._channel(room_id))
+
+    async def publish(self, room_id: str, frame: str):
+        await self.redis.publish(self._channel(room_id), f"{self.worker_id}:{frame}")
+
+    async def _read(self):
+        prefix = len(config.COLLAB_CHANNEL_PREFIX)
+        while self.rooms:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:
+                print(f"Collaboration pub/sub read failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not message or message['type'] != 'message':
+                continue
+
+            origin, _, frame = message['data'].partition(':')
+            if origin != self.worker_id and self._deliver:
+                self._deliver(message['channel'][prefix:], frame)
+
+    def _channel(self, room_id: str) -> str:
+        return f"{config.COLLAB_CHANNEL_PREFIX}{room_id}"
+
+
+def create_broadcast_backend():
+    if config.COLLAB_BACKEND == 'redis':
+        return RedisBroadcast()
+    return LocalBroadcast()
+
+
+class ConnectionManager:
+    def __init__(self, backend=None):
+        self.active_connections: Dict[WebSocket, Connection] = {}
+        self.room_connections: Dict[str, Set[Connection]] = {}
+        self.backend = backend or create_broadcast_backend()
+        self.backend.start(self._deliver_local)
+        self.batches: Dict[str, FrameBatcher] = {}
+        self._ticker: Optional[asyncio.Task] = None
+        self.stats = {'coalesced_in': 0, 'batches_out': 0}
+
+    async def connect(self, websocket: WebSocket, room_id: str = "default"):
+        codec, subprotocol = negotiate(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        connection = Connection(websocket, room_id, self._remove, codec)
+        self.active_connections[websocket] = connection
+        room = self.room_connections.get(room_id)
+        if room is not None:
+            room.add(connection)
+            return
+
+        # Later joiners see the entry and skip join(), so it only stays if the join succeeds
+        room = self.room_connections[room_id] = {connection}
+        try:
+            await self.backend.join(room_id)
+        except Exception:
+            if self.room_connections.get(room_id) is room:
+                del self.room_connections[room_id]
+            # Everyone who arrived while the join was in flight is unsubscribed too
+            for member in list(room):
+                member.close(code=1011)
+            raise
+
+    def disconnect(self, websocket: WebSocket, room_id: str = "default"):
+        connection = self.active_connections.get(websocket)
+        if connection is not None:
+            connection.close()
+
+    async def receive(self, websocket: WebSocket) -> Dict:
+        event = await websocket.receive()
+        connection = self.active_connections.get(websocket)
+        if event['type'] == 'websocket.disconnect' or connection is None:
+            raise WebSocketDisconnect(event.get('code', 1000))
+        data = event.get('bytes') if event.get('bytes') is not None else event.get('text')
+        return connection.codec.decode(data)
+
+    async def broadcast_to_room(self, message: Union[str, Dict], room_id: str):
+        # Serialize once per wire protocol; every recipient queues the same frame object.
+        # Other workers always get the JSON frame.
+        frame = message if isinstance(message, str) else json.dumps(message)
+        self._deliver_local(room_id, frame, None if isinstance(message, str) else message)
+        await self.backend.publish(room_id, frame)
+
+    def send(self, websocket: WebSocket, message: Union[str, Dict]):
+        # Goes through the connection's queue so it stays ordered with room broadcasts
+        connection = self.active_connections.get(websocket)
+        if connection is None:
+            return
+        if isinstance(message, str):
+            frame = connection.codec.encode(json.loads(message)) if connection.codec.binary else message
+        else:
+            frame = connection.codec.encode(message)
+        connection.offer(frame)
+
+    def queue_cursor(self, message: Dict, room_id: str):
+        self._batch(room_id).add_cursor(message)
+
+    def queue_canvas(self, message: Dict, room_id: str):
+        self._batch(room_id).add_canvas(message)
+
+    def _batch(self, room_id: str) -> FrameBatcher:
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.create_task(self._tick())
+        if room_id not in self.batches:
+            self.batches[room_id] = FrameBatcher()
+        return self.batches[room_id]
+
+    async def _tick(self):
+        # One ticker for all rooms: each tick ships at most one batch frame per room
+        interval = 1.0 / config.COLLAB_TICK_HZ
+        while self.batches:
+            await asyncio.sleep(interval)
+            for room_id in list(self.batches):
+                batch = self.batches[room_id]
+                messages = batch.drain()
+                if not messages:
+                    # Idle since the last tick; forget it until the next update
+                    del self.batches[room_id]
+                    continue
+                self.stats['coalesced_in'] += batch.received
+                self.stats['batches_out'] += 1
+                batch.received = 0
+                try:
+                    await self.broadcast_to_room({'type': 'batch', 'messages': messages}, room_id)
+                except Exception as e:
+                    print(f"Batch broadcast to room {room_id} failed: {e}")
+
+    def _deliver_local(self, room_id: str, frame: str, message: Dict = None):
+        frames: Dict[str, Frame] = {'json': frame}
+        for connection in list(self.room_connections.get(room_id, ())):
+            codec = connection.codec
+            if codec.name not in frames:
+                if message is None:
+                    message = json.loads(frame)
+                frames[codec.name] = codec.encode(message)
+            connection.offer(frames[codec.name])
+
+    def room_stats(self, room_id: str) -> Dict:
+        connections = self.room_connections.get(room_id, set())
+        return {
+            'connections': len(connections),
+            'queued_frames': sum(c.queue.qsize() for c in connections),
+            'dropped_frames': sum(c.dropped for c in connections)
+        }
+
+    def _remove(self, connection: Connection):
+        self.active_connections.pop(connection.websocket, None)
+        room = self.room_connections.get(connection.room_id)
+        if room is not None:
+            room.discard(connection)
+            if not room:
+                del self.room_connections[connection.room_id]
+                asyncio.create_task(self._leave_if_empty(connection.room_id))
+
+    async def _leave_if_empty(self, room_id: str):
+        # Someone may have rejoined between scheduling and running this
+        if room_id not in self.room_connections:
+            await self.backend.leave(room_id)
@@ -1,4 +1,5 @@
 import os
+import json
 from typing import Optional
 
 class Config:
@@ -16,12 +17,131 @@ class Config:
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
     
+    # Firestore write-behind batching
+    FIRESTORE_BATCH_SIZE: int = int(os.getenv("FIRESTORE_BATCH_SIZE", "500"))  # ops per commit, max 500
+    FIRESTORE_FLUSH_INTERVAL: float = float(os.getenv("FIRESTORE_FLUSH_INTERVAL", "0.5"))  # seconds
+    FIRESTORE_MAX_PENDING: int = int(os.getenv("FIRESTORE_MAX_PENDING", "10000"))
+    FIRESTORE_MAX_RETRIES: int = int(os.getenv("FIRESTORE_MAX_RETRIES", "5"))  # retries of a batch after a transient error
+    FIRESTORE_RETRY_DELAY: float = float(os.getenv("FIRESTORE_RETRY_DELAY", "0.5"))  # seconds, doubled per retry
+    
+    # Redis
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+    
+    # LLM response cache
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_TTL: int = int(os.getenv("LLM_CACHE_TTL", "3600"))  # seconds
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+    LLM_CACHE_MAX_BYTES: int = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    LLM_CACHE_REDIS: bool = os.getenv("LLM_CACHE_REDIS", "true").lower() == "true"
+    
+    # LLM rate limits: requests/min, tokens/min and max concurrent requests
+    PROVIDER_RATE_LIMITS: dict = json.loads(os.getenv("PROVIDER_RATE_LIMITS", json.dumps({
+        "anthropic": {"rpm": 50, "tpm": 40000, "concurrency": 10},
+        "openai": {"rpm": 500, "tpm": 150000, "concurrency": 20},
+        "gemini": {"rpm": 60, "tpm": 120000, "concurrency": 10}
+    })))
+    MODEL_RATE_LIMITS: dict = json.loads(os.getenv("MODEL_RATE_LIMITS", json.dumps({
+        "claude-3-opus-20240229": {"rpm": 20, "tpm": 20000, "concurrency": 4},
+        "gpt-4-turbo-preview": {"rpm": 300, "tpm": 80000, "concurrency": 10}
+    })))
+    DEFAULT_COMPLETION_TOKENS: int = 1000
+    
+    # LLM retries, deadlines and hedging
+    RETRY_MAX_ATTEMPTS: int = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+    RETRY_BASE_DELAY: float = float(os.getenv("RETRY_BASE_DELAY", "0.5"))  # seconds
+    RETRY_MAX_DELAY: float = float(os.getenv("RETRY_MAX_DELAY", "8"))  # seconds
+    RETRY_HEDGE_ENABLED: bool = os.getenv("RETRY_HEDGE_ENABLED", "true").lower() == "true"
+    RETRY_HEDGE_QUANTILE: float = float(os.getenv("RETRY_HEDGE_QUANTILE", "0.95"))
+    RETRY_HEDGE_MIN_SAMPLES: int = int(os.getenv("RETRY_HEDGE_MIN_SAMPLES", "20"))
+    MODEL_STATS_WINDOW: int = int(os.getenv("MODEL_STATS_WINDOW", "200"))  # calls per model
+    REQUEST_DEADLINE: float = float(os.getenv("REQUEST_DEADLINE", "60"))  # seconds
+    PIPELINE_DEADLINE: float = float(os.getenv("PIPELINE_DEADLINE", "300"))  # seconds
+    
+    # Per-model circuit breakers and role failover
+    BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))  # consecutive failures
+    BREAKER_ERROR_RATE: float = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+    BREAKER_MIN_CALLS: int = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+    BREAKER_COOLDOWN: float = float(os.getenv("BREAKER_COOLDOWN", "30"))  # seconds
+    BREAKER_DEGRADED_P95: float = float(os.getenv("BREAKER_DEGRADED_P95", "30"))  # seconds
+    MODEL_FALLBACKS: dict = json.loads(os.getenv("MODEL_FALLBACKS", json.dumps({
+        "architect": ["gpt-4-turbo-preview"],
+        "coder": ["claude-3-sonnet-20240229"],
+        "reviewer": ["claude-3-sonnet-20240229", "gpt-4-turbo-preview"],
+        "explainer": ["claude-3-sonnet-20240229"],
+        "debugger": ["claude-3-sonnet-20240229"],
+        "optimizer": ["gpt-4-turbo-preview"]
+    })))
+    
+    # Consensus: stop once the leading choice holds this much vote weight (0 waits for every model)
+    CONSENSUS_QUORUM: float = float(os.getenv("CONSENSUS_QUORUM", "2"))
+    # Let askers cut off by an early quorum finish in the background so their answers get cached
+    CONSENSUS_FINISH_STRAGGLERS: bool = os.getenv("CONSENSUS_FINISH_STRAGGLERS", "false").lower() == "true"
+    CONSENSUS_WEIGHTS: dict = json.loads(os.getenv("CONSENSUS_WEIGHTS", json.dumps({
+        "claude": 1.0,
+        "gpt": 1.0,
+        "gemini": 1.0
+    })))
+    
+    # Collaboration WebSockets
+    COLLAB_BACKEND: str = os.getenv("COLLAB_BACKEND", "local")  # local | redis (needed for >1 worker)
+    COLLAB_CHANNEL_PREFIX: str = "collab:room:"
+    COLLAB_SEND_QUEUE_SIZE: int = int(os.getenv("COLLAB_SEND_QUEUE_SIZE", "256"))  # frames per connection
+    COLLAB_SEND_TIMEOUT: float = float(os.getenv("COLLAB_SEND_TIMEOUT", "10"))  # seconds per frame
+    COLLAB_SLOW_CONSUMER_POLICY: str = os.getenv("COLLAB_SLOW_CONSUMER_POLICY", "drop")  # drop | disconnect
+    COLLAB_MAX_CONSECUTIVE_DROPS: int = int(os.getenv("COLLAB_MAX_CONSECUTIVE_DROPS", "1024"))
+    COLLAB_TICK_HZ: float = float(os.getenv("COLLAB_TICK_HZ", "30"))  # batched cursor/canvas frames per second
+    COLLAB_DOC_HISTORY: int = int(os.getenv("COLLAB_DOC_HISTORY", "500"))  # applied changes kept for rebasing late edits
+    COLLAB_DOC_COMPACT_EVERY: int = int(os.getenv("COLLAB_DOC_COMPACT_EVERY", "100"))  # changes between snapshots
+    COLLAB_MAX_DOCUMENT_ROOMS: int = int(os.getenv("COLLAB_MAX_DOCUMENT_ROOMS", "1000"))
+    COLLAB_PER_MESSAGE_DEFLATE: bool = os.getenv("COLLAB_PER_MESSAGE_DEFLATE", "true").lower() == "true"
+    
     # Voice Engine
     VOICE_SAMPLE_RATE: int = 16000
+    VOICE_SAMPLE_WIDTH: int = 2  # bytes per sample, 16-bit mono PCM
+    VOICE_FRAME_MS: int = int(os.getenv("VOICE_FRAME_MS", "100"))  # audio per frame sent to the transcriber
+    VOICE_BUFFER_SECONDS: int = int(os.getenv("VOICE_BUFFER_SECONDS", "5"))  # buffered audio before the socket stops being read
+    
+    # Transcription
+    TRANSCRIPTION_BACKEND: str = os.getenv("TRANSCRIPTION_BACKEND", "assemblyai")  # assemblyai | local | replay
+    TRANSCRIPTION_MODEL: str = os.getenv("TRANSCRIPTION_MODEL", "base.en")  # faster-whisper model for the local backend
+    TRANSCRIPTION_DEVICE: str = os.getenv("TRANSCRIPTION_DEVICE", "cpu")
+    TRANSCRIPTION_COMPUTE_TYPE: str = os.getenv("TRANSCRIPTION_COMPUTE_TYPE", "int8")
+    TRANSCRIPTION_WORKERS: int = int(os.getenv("TRANSCRIPTION_WORKERS", str(os.cpu_count() or 1)))  # decoder processes
+    TRANSCRIPTION_PARTIAL_SECONDS: float = 1.0  # audio between local partial results
+    TRANSCRIPTION_SILENCE_MS: int = 700  # quiet that ends a local utterance
+    TRANSCRIPTION_SILENCE_RMS: float = 500.0  # 16-bit RMS below which a frame counts as silence
+    TRANSCRIPTION_MAX_UTTERANCE_SECONDS: int = 30
+    TRANSCRIPTION_REPLAY_PATH: str = os.getenv("TRANSCRIPTION_REPLAY_PATH", "")  # JSON lines script for the replay backend
+    TRANSCRIPTION_REPLAY_UTTERANCE_SECONDS: float = float(os.getenv("TRANSCRIPTION_REPLAY_UTTERANCE_SECONDS", "2"))
     CONTEXT_WINDOW_SIZE: int = 10
+    VOICE_PROMPT_CONTEXT: int = 3  # recent utterances included in the intent prompt
+    VOICE_CONTEXT_BACKEND: str = os.getenv("VOICE_CONTEXT_BACKEND", "memory")  # memory | redis (needed for >1 worker)
+    VOICE_CONTEXT_TTL: int = int(os.getenv("VOICE_CONTEXT_TTL", "3600"))  # seconds a user's spilled context survives
+    VOICE_SPECULATION_MIN_WORDS: int = int(os.getenv("VOICE_SPECULATION_MIN_WORDS", "3"))  # partial words before guessing intent
+    VOICE_GRAMMAR_CONFIDENCE: float = 0.95
+    VOICE_LOCAL_MIN_SCORE: float = float(os.getenv("VOICE_LOCAL_MIN_SCORE", "0.6"))  # cosine similarity to answer locally
+    VOICE_LOCAL_MIN_MARGIN: float = float(os.getenv("VOICE_LOCAL_MIN_MARGIN", "0.15"))  # lead over the runner-up intent
+    VOICE_CLASSIFIER_MAX_EXAMPLES: int = int(os.getenv("VOICE_CLASSIFIER_MAX_EXAMPLES", "5000"))
+    VOICE_CLASSIFIER_MIN_EXAMPLES: int = int(os.getenv("VOICE_CLASSIFIER_MIN_EXAMPLES", "20"))  # labelled examples per intent before the scorer answers
+    VOICE_CLASSIFIER_REFIT_EVERY: int = 50  # new LLM-labelled examples before refitting
     
     # Notion Sync
     SYNC_INTERVAL: int = 30  # seconds
+    SYNC_MIN_INTERVAL: float = float(os.getenv("SYNC_MIN_INTERVAL", "5"))  # busiest a workspace gets polled
+    SYNC_MAX_INTERVAL: float = float(os.getenv("SYNC_MAX_INTERVAL", "600"))  # idlest
+    SYNC_BACKOFF: float = 1.5  # interval growth per run without changes
+    SYNC_WORKERS: int = int(os.getenv("SYNC_WORKERS", "4"))  # concurrent workspace syncs for all users
+    NOTION_PAGE_SIZE: int = 100  # Notion's maximum page_size
+    NOTION_REQUESTS_PER_SECOND: float = float(os.getenv("NOTION_REQUESTS_PER_SECOND", "3"))  # Notion's average rate limit
+    NOTION_MAX_CONCURRENCY: int = int(os.getenv("NOTION_MAX_CONCURRENCY", "3"))  # Notion requests in flight per process
+    NOTION_MAX_RETRIES: int = int(os.getenv("NOTION_MAX_RETRIES", "5"))  # attempts per request before a 429 is surfaced
+    NOTION_BOOTSTRAP_CONCURRENCY: int = int(os.getenv("NOTION_BOOTSTRAP_CONCURRENCY", "2"))  # workspaces bootstrapping at once
+    NOTION_BLOCK_CONCURRENCY: int = int(os.getenv("NOTION_BLOCK_CONCURRENCY", "3"))  # block list requests in flight per process
+    NOTION_PAGE_CACHE_SIZE: int = int(os.getenv("NOTION_PAGE_CACHE_SIZE", "1000"))  # rendered page versions kept
+    NOTION_PAGE_VERSION_TTL: float = float(os.getenv("NOTION_PAGE_VERSION_TTL", "30"))  # seconds a seen last_edited_time is trusted
+    NOTION_LINKS_REDIS: bool = os.getenv("NOTION_LINKS_REDIS", "true").lower() == "true"  # mirror file<->page links for fast warm starts
+    NOTION_LINKS_WARM_TIMEOUT: float = float(os.getenv("NOTION_LINKS_WARM_TIMEOUT", "30"))  # seconds startup waits for the link index
     DOCS_DATABASE_ID: str = os.getenv("NOTION_DOCS_DB_ID", "your_docs_database_id")
 
 config = Config()
\ No newline at end of file
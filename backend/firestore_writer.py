@@ -0,0 +1,151 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from firebase_admin import firestore
+
+from config import config
+from rate_limiter import status_code_of
+
+FIRESTORE_BATCH_LIMIT = 500  # hard limit on operations per Firestore batch commit
+TRANSIENT_STATUS = (429, 500, 503, 504)  # resource exhausted, internal, unavailable, deadline exceeded
+
+
+def is_transient(exc: Exception) -> bool:
+    return status_code_of(exc) in TRANSIENT_STATUS or isinstance(exc, (ConnectionError, TimeoutError))
+
+
+class FirestoreBatchWriter:
+    """
+    Write-behind queue for Firestore. Callers enqueue writes and return
+    immediately; a background task groups them into batch commits of up to 500
+    operations, flushing when a batch fills or flush_interval has passed since
+    its first write. put() blocks once max_pending writes are queued, which
+    pushes back on producers instead of growing memory without bound.
+
+    A batch commit is atomic, so one bad write would take the whole batch down
+    with it. Transient errors are retried with backoff; on any other error the
+    batch is bisected until the offending write is isolated, and only that one
+    is dropped (counted in stats['dropped']).
+    """
+
+    def __init__(self, db=None, batch_size: int = None, flush_interval: float = None, max_pending: int = None):
+        self._db = db
+        self.batch_size = min(batch_size or config.FIRESTORE_BATCH_SIZE, FIRESTORE_BATCH_LIMIT)
+        self.flush_interval = flush_interval or config.FIRESTORE_FLUSH_INTERVAL
+        self.max_pending = max_pending or config.FIRESTORE_MAX_PENDING
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0, 'retries': 0, 'commits': 0}
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = firestore.client()
+        return self._db
+
+    def document(self, collection: str, document_id: str = None):
+        collection_ref = self.db.collection(collection)
+        return collection_ref.document(document_id) if document_id else collection_ref.document()
+
+    async def set(self, ref, data: Dict, merge: bool = False):
+        await self._put(('set', ref, data, merge))
+
+    async def update(self, ref, data: Dict):
+        await self._put(('update', ref, data, None))
+
+    async def add(self, collection: str, data: Dict) -> str:
+        # Ids are generated client-side, so callers get them without waiting for the write
+        ref = self.document(collection)
+        await self.set(ref, data)
+        return ref.id
+
+    async def flush(self):
+        if self._task is None:
+            return
+        done = asyncio.get_running_loop().create_future()
+        await self._queue.put(('flush', done, None, None))
+        await done
+
+    async def close(self):
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        self._task = None
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def _put(self, op: Tuple):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = asyncio.create_task(self._run())
+        await self._queue.put(op)
+        self.stats['queued'] += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            ops = [await self._queue.get()]
+            waiters = []
+            deadline = loop.time() + self.flush_interval
+
+            while len(ops) < self.batch_size and ops[-1][0] != 'flush':
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    ops.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            writes = []
+            for op in ops:
+                if op[0] == 'flush':
+                    waiters.append(op[1])
+                else:
+                    writes.append(op)
+
+            if writes:
+                await self._commit(writes)
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def _commit(self, writes: List[Tuple]):
+        attempt = 0
+        while True:
+            try:
+                await asyncio.to_thread(self._commit_sync, writes)
+                break
+            except Exception as e:
+                if is_transient(e) and attempt < config.FIRESTORE_MAX_RETRIES:
+                    self.stats['retries'] += 1
+                    await asyncio.sleep(config.FIRESTORE_RETRY_DELAY * 2 ** attempt)
+                    attempt += 1
+                    continue
+                if len(writes) > 1 and not is_transient(e):
+                    # Halves commit in order, so writes to the same document keep their order
+                    middle = len(writes) // 2
+                    await self._commit(writes[:middle])
+                    await self._commit(writes[middle:])
+                    return
+                self.stats['dropped'] += len(writes)
+                print(f"Dropping {len(writes)} Firestore write(s), first to {writes[0][1].path}: {e}")
+                return
+
+        self.stats['written'] += len(writes)
+        self.stats['commits'] += 1
+
+    def _commit_sync(self, writes: List[Tuple]):
+        batch = self.db.batch()
+        for kind, ref, data, merge in writes:
+            if kind == 'set':
+                batch.set(ref, data, merge=merge)
+            else:
+                batch.update(ref, data)
+        batch.commit()
+
+
+firestore_writer = FirestoreBatchWriter()
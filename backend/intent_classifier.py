@@ -0,0 +1,169 @@
+import asyncio
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from config import config
+
+INTENTS = ('create', 'modify', 'delete', 'debug', 'test', 'explain')
+TARGETS = ('function', 'class', 'endpoint', 'test', 'file')
+_TARGET = r"(function|method|class|endpoint|route|tests?|file)"
+
+# (intent, pattern) tried in order; the first match wins. Only phrasings that are
+# unambiguous on their own belong here, everything else goes to the scorer.
+GRAMMAR: List[Tuple[str, re.Pattern]] = [
+    ('test', re.compile(r"^(?:please )?(?:run|rerun|execute) (?:all |the |my )*(?:unit |integration )?tests?\b")),
+    ('delete', re.compile(rf"^(?:please )?(?:delete|remove) (?:this|that|the|a) {_TARGET}\b")),
+    ('create', re.compile(rf"^(?:please )?(?:create|write|add|generate) (?:a|an)(?: new)? {_TARGET}(?: (?:called|named|that|which|for|with)\b|$)")),
+    ('modify', re.compile(rf"^(?:please )?(?:rename|refactor|update|modify|change) (?:this|that|the) {_TARGET}\b")),
+    ('debug', re.compile(r"^(?:please )?(?:debug|fix) (?:this|that|the)\b")),
+    ('explain', re.compile(r"^(?:please )?(?:explain (?:this|that|the)\b|what does (?:this|that)(?: \w+)? do$)")),
+]
+
+SEED_EXAMPLES: List[Tuple[str, str]] = [
+    ('run the tests', 'test'),
+    ('run the unit tests for this file', 'test'),
+    ('delete this function', 'delete'),
+    ('remove the unused imports', 'delete'),
+    ('create a function that parses dates', 'create'),
+    ('write a new endpoint for user login', 'create'),
+    ('rename this variable', 'modify'),
+    ('refactor this class to use composition', 'modify'),
+    ('why is this throwing an exception', 'debug'),
+    ('fix the bug in the login handler', 'debug'),
+    ('explain what this function does', 'explain'),
+    ('what does this code do', 'explain'),
+]
+
+
+# Carry no intent on their own; left in, "run the server" scores as a test run
+STOPWORDS = frozenset((
+    'a', 'an', 'the', 'this', 'that', 'these', 'those', 'it', 'its', 'to', 'for', 'of', 'in',
+    'on', 'at', 'with', 'and', 'or', 'is', 'are', 'be', 'me', 'my', 'i', 'you', 'your', 'we',
+    'our', 'please', 'can', 'could', 'would', 'will', 'just', 'now', 'run', 'do', 'does'
+))
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def terms(text: str) -> List[str]:
+    return [token for token in tokenize(text) if token not in STOPWORDS]
+
+
+def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    return {t: v / norm for t, v in vector.items()} if norm else vector
+
+
+class IntentClassifier:
+    """
+    Local tier in front of the LLM intent call. A regex grammar catches the
+    stock phrasings outright; otherwise a TF-IDF nearest-centroid scorer trained
+    on past LLM-labelled utterances answers when its best intent is both similar
+    enough and clearly ahead of the runner-up. The scorer stays silent until
+    every intent has VOICE_CLASSIFIER_MIN_EXAMPLES labelled examples beyond the
+    seeds. Returns None to escalate.
+    """
+
+    def __init__(self):
+        self.examples: List[Tuple[str, str]] = []
+        self.scorer_ready = False
+        self.idf: Dict[str, float] = {}
+        self.centroids: Dict[str, Dict[str, float]] = {}
+        self.pending = 0
+        self.stats = {'grammar': 0, 'scorer': 0, 'escalated': 0}
+        self.fit()
+
+    def classify(self, text: str) -> Optional[Dict]:
+        words = ' '.join(tokenize(text))
+
+        for intent, pattern in GRAMMAR:
+            match = pattern.search(words)
+            if match:
+                self.stats['grammar'] += 1
+                target = match.group(1) if match.groups() else None
+                return self._intent(intent, text, target, config.VOICE_GRAMMAR_CONFIDENCE)
+
+        if self.pending >= config.VOICE_CLASSIFIER_REFIT_EVERY:
+            self.fit()
+
+        scores = self.score(text) if self.scorer_ready else None
+        if scores:
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            best, score = ranked[0]
+            runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+            if score >= config.VOICE_LOCAL_MIN_SCORE and score - runner_up >= config.VOICE_LOCAL_MIN_MARGIN:
+                self.stats['scorer'] += 1
+                return self._intent(best, text, None, round(score, 3))
+
+        self.stats['escalated'] += 1
+        return None
+
+    def score(self, text: str) -> Dict[str, float]:
+        vector = self._vector(terms(text))
+        return {
+            intent: sum(weight * centroid.get(term, 0.0) for term, weight in vector.items())
+            for intent, centroid in self.centroids.items()
+        }
+
+    def add_example(self, text: str, intent: str):
+        if intent and intent != 'unknown':
+            self.examples.append((text, intent))
+            self.examples = self.examples[-config.VOICE_CLASSIFIER_MAX_EXAMPLES:]
+            self.pending += 1
+
+    def fit(self):
+        documents = [(Counter(terms(text)), intent) for text, intent in SEED_EXAMPLES + self.examples]
+        document_frequency = Counter(term for counts, _ in documents for term in counts)
+        total = len(documents)
+        self.idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()}
+
+        sums: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for counts, intent in documents:
+            for term, weight in self._vector(list(counts.elements())).items():
+                sums[intent][term] += weight
+        self.centroids = {intent: _normalize(dict(weights)) for intent, weights in sums.items()}
+        self.pending = 0
+
+        labelled = Counter(intent for _, intent in self.examples)
+        self.scorer_ready = all(labelled[intent] >= config.VOICE_CLASSIFIER_MIN_EXAMPLES for intent in INTENTS)
+
+    async def train_from_firestore(self, db, limit: int = None):
+        # Only learn from LLM-labelled interactions, never from our own guesses
+        def load():
+            return db.collection('voice_interactions').limit(limit or config.VOICE_CLASSIFIER_MAX_EXAMPLES).get()
+
+        try:
+            docs = await asyncio.to_thread(load)
+        except Exception as e:
+            print(f"Loading voice interactions for the intent classifier failed: {e}")
+            return
+
+        for doc in docs:
+            data = doc.to_dict()
+            intent = data.get('intent') or {}
+            if intent.get('source') != 'local' and data.get('command'):
+                self.add_example(data['command'], intent.get('intent'))
+        self.fit()
+
+    def _vector(self, tokens: List[str]) -> Dict[str, float]:
+        counts = Counter(tokens)
+        return _normalize({t: c * self.idf[t] for t, c in counts.items() if t in self.idf})
+
+    def _intent(self, intent: str, text: str, target: Optional[str], confidence: float) -> Dict:
+        if target is None:
+            words = set(tokenize(text))
+            target = next((t for t in TARGETS if t in words or t + 's' in words), None)
+        elif target.rstrip('s') in ('test', 'method', 'route'):
+            target = {'method': 'function', 'route': 'endpoint'}.get(target.rstrip('s'), 'test')
+        return {
+            'intent': intent,
+            'target': target or 'file',
+            'action': text.strip(),
+            'parameters': {},
+            'confidence': confidence,
+            'source': 'local'
+        }
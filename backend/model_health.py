@@ -0,0 +1,180 @@
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from config import config
+
+
+class ModelStats:
+    """
+    Rolling window of recent call outcomes for one model: (timestamp, latency, ok).
+    """
+
+    def __init__(self, window: int = None):
+        self.calls: Deque[Tuple[float, float, bool]] = deque(maxlen=window or config.MODEL_STATS_WINDOW)
+
+    def record(self, latency: float, ok: bool):
+        self.calls.append((time.time(), latency, ok))
+
+    def percentile(self, q: float) -> Optional[float]:
+        latencies = sorted(latency for _, latency, ok in self.calls if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(q * len(latencies)))
+        return latencies[index]
+
+    def error_rate(self) -> float:
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, _, ok in self.calls if not ok) / len(self.calls)
+
+    def successes(self) -> int:
+        return sum(1 for _, _, ok in self.calls if ok)
+
+    def summary(self) -> Dict:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            'calls': len(self.calls),
+            'error_rate': round(self.error_rate(), 3),
+            'p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+            'p95_ms': round(p95 * 1000, 1) if p95 is not None else None
+        }
+
+
+class HealthRegistry:
+    def __init__(self):
+        self.models: Dict[str, ModelStats] = {}
+        self.breakers: Dict[str, 'CircuitBreaker'] = {}
+
+    def stats(self, model: str) -> ModelStats:
+        if model not in self.models:
+            self.models[model] = ModelStats()
+            self.breakers[model] = CircuitBreaker(self.models[model])
+        return self.models[model]
+
+    def breaker(self, model: str) -> 'CircuitBreaker':
+        self.stats(model)
+        return self.breakers[model]
+
+    def record(self, model: str, latency: float, ok: bool):
+        self.stats(model).record(latency, ok)
+        self.breakers[model].on_result(ok)
+
+    def allow(self, model: str) -> bool:
+        return self.breaker(model).allow()
+
+    def probe_due(self, model: str) -> bool:
+        return self.breaker(model).probe_due()
+
+    def rank(self, model: str) -> int:
+        # Lower is better: healthy, then degraded or probing, then open
+        return {'closed': 0, 'degraded': 1, 'half_open': 1, 'open': 2}[self.breaker(model).status()]
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        # Only hedge once there are enough samples for the quantile to mean something
+        stats = self.stats(model)
+        if not config.RETRY_HEDGE_ENABLED or stats.successes() < config.RETRY_HEDGE_MIN_SAMPLES:
+            return None
+        return stats.percentile(config.RETRY_HEDGE_QUANTILE)
+
+    def summary(self) -> Dict:
+        return {
+            model: {**stats.summary(), 'state': self.breakers[model].status()}
+            for model, stats in self.models.items()
+        }
+
+
+class CircuitBreaker:
+    """
+    Per-model breaker. Trips open after consecutive failures or a high error rate
+    since it last closed, rejects calls for a cooldown, then lets a single probe
+    through (half-open) to decide whether to close again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, stats: ModelStats):
+        self.stats = stats
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.closed_at = time.time()
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+        self.probe_started = 0.0
+
+    def allow(self) -> bool:
+        now = time.time()
+        if self.state == self.OPEN and now - self.opened_at >= config.BREAKER_COOLDOWN:
+            self.state = self.HALF_OPEN
+            self.probe_in_flight = False
+
+        if self.state == self.CLOSED:
+            return True
+        # A probe that never reported back (cancelled, deadline) must not wedge the breaker
+        if self.state == self.HALF_OPEN and (
+            not self.probe_in_flight or now - self.probe_started >= config.BREAKER_COOLDOWN
+        ):
+            self.probe_in_flight = True
+            self.probe_started = now
+            return True
+        return False
+
+    def on_result(self, ok: bool):
+        if self.state == self.HALF_OPEN:
+            if ok:
+                self._close()
+            else:
+                self._open()
+            return
+
+        if ok:
+            self.consecutive_failures = 0
+            return
+
+        self.consecutive_failures += 1
+        recent = [c for c in self.stats.calls if c[0] >= self.closed_at]
+        error_rate = sum(1 for _, _, call_ok in recent if not call_ok) / len(recent) if recent else 0.0
+
+        if self.consecutive_failures >= config.BREAKER_FAILURE_THRESHOLD or (
+            len(recent) >= config.BREAKER_MIN_CALLS and error_rate >= config.BREAKER_ERROR_RATE
+        ):
+            self._open()
+
+    def probe_due(self) -> bool:
+        # True when allow() would let the next call through as a probe
+        now = time.time()
+        if self.state == self.OPEN:
+            return now - self.opened_at >= config.BREAKER_COOLDOWN
+        return self.state == self.HALF_OPEN and (
+            not self.probe_in_flight or now - self.probe_started >= config.BREAKER_COOLDOWN
+        )
+
+    def degraded(self) -> bool:
+        p95 = self.stats.percentile(0.95)
+        return p95 is not None and p95 > config.BREAKER_DEGRADED_P95
+
+    def status(self) -> str:
+        if self.state == self.CLOSED and self.degraded():
+            return 'degraded'
+        if self.state == self.OPEN and time.time() - self.opened_at >= config.BREAKER_COOLDOWN:
+            # allow() only makes the move on the next call; report what that call will see
+            return self.HALF_OPEN
+        return self.state
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self.probe_in_flight = False
+
+    def _close(self):
+        self.state = self.CLOSED
+        self.closed_at = time.time()
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+
+class CircuitOpenError(Exception):
+    pass
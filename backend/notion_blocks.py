@@ -0,0 +1,148 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import config
+from notion_gateway import INTERACTIVE
+
+# Blocks whose children belong to another page or database, not to this one
+DETACHED_CHILDREN = ('child_page', 'child_database')
+
+
+def plain_text(rich_text: List[Dict]) -> str:
+    return ''.join(segment.get('plain_text') or segment.get('text', {}).get('content', '') for segment in rich_text)
+
+
+def render_block(block: Dict) -> Optional[str]:
+    kind = block['type']
+    value = block.get(kind) or {}
+    text = plain_text(value.get('rich_text', []))
+
+    if kind == 'heading_1':
+        return f"# {text}"
+    if kind == 'heading_2':
+        return f"## {text}"
+    if kind == 'heading_3':
+        return f"### {text}"
+    if kind == 'bulleted_list_item':
+        return f"- {text}"
+    if kind == 'numbered_list_item':
+        return f"1. {text}"
+    if kind == 'to_do':
+        return f"[{'x' if value.get('checked') else ' '}] {text}"
+    if kind == 'quote':
+        return f"> {text}"
+    if kind == 'callout':
+        icon = (value.get('icon') or {}).get('emoji', '')
+        return f"{icon} {text}".strip()
+    if kind == 'code':
+        return f"```{value.get('language', '')}\n{text}\n```"
+    if kind == 'equation':
+        return value.get('expression', '')
+    if kind == 'divider':
+        return '---'
+    if kind == 'table_row':
+        return ' | '.join(plain_text(cell) for cell in value.get('cells', []))
+    if kind in ('child_page', 'child_database'):
+        return f"[{value.get('title', '')}]"
+    if kind in ('bookmark', 'embed', 'link_preview'):
+        return value.get('url', '')
+    if kind in ('image', 'file', 'pdf', 'video', 'audio'):
+        caption = plain_text(value.get('caption', []))
+        source = value.get(value.get('type', ''), {}).get('url', '')
+        return caption or source
+    if kind in ('paragraph', 'toggle', 'template'):
+        return text
+    # Containers (column_list, column, synced_block, table) render only their children
+    return None
+
+
+def render_tree(blocks: List[Dict], depth: int = 0) -> List[str]:
+    lines = []
+    indent = '  ' * depth
+    for block in blocks:
+        line = render_block(block)
+        if line:
+            lines.extend(indent + part for part in line.split('\n'))
+        nested = depth + 1 if line is not None else depth
+        lines.extend(render_tree(block.get('children', []), nested))
+    return lines
+
+
+class BlockTreeFetcher:
+    """
+    Reads a page's full block tree: every page of children, recursively
+    expanded, with at most NOTION_BLOCK_CONCURRENCY list requests in flight
+    across the whole tree. Rendered text is cached per (page id,
+    last_edited_time), so an unchanged page is never fetched twice.
+    """
+
+    def __init__(self, gateway, concurrency: int = None, cache_size: int = None):
+        self.gateway = gateway
+        self.slots = asyncio.Semaphore(concurrency or config.NOTION_BLOCK_CONCURRENCY)
+        self.cache_size = cache_size or config.NOTION_PAGE_CACHE_SIZE
+        self.cache: 'OrderedDict[Tuple[str, str], str]' = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'requests': 0}
+
+    def cached(self, page_id: str, last_edited_time: str) -> Optional[str]:
+        text = self.cache.get((page_id, last_edited_time))
+        if text is not None:
+            self.cache.move_to_end((page_id, last_edited_time))
+        return text
+
+    def rekey(self, page_id: str, old_edited_time: str, new_edited_time: str):
+        # For our own property-only edits, which bump last_edited_time but not the blocks
+        text = self.cache.pop((page_id, old_edited_time), None)
+        if text is not None:
+            self._store(page_id, new_edited_time, text)
+
+    async def page_text(self, page_id: str, last_edited_time: str = None) -> str:
+        if last_edited_time:
+            text = self.cached(page_id, last_edited_time)
+            if text is not None:
+                self.stats['hits'] += 1
+                return text
+
+        self.stats['misses'] += 1
+        text = '\n'.join(render_tree(await self.fetch_tree(page_id)))
+        if last_edited_time:
+            self._store(page_id, last_edited_time, text)
+        return text
+
+    async def fetch_tree(self, block_id: str) -> List[Dict]:
+        blocks = await self.list_children(block_id)
+        expand = [
+            block for block in blocks
+            if block.get('has_children') and block['type'] not in DETACHED_CHILDREN
+        ]
+        children = await asyncio.gather(*(self.fetch_tree(self._children_source(block)) for block in expand))
+        for block, nested in zip(expand, children):
+            block['children'] = nested
+        return blocks
+
+    async def list_children(self, block_id: str) -> List[Dict]:
+        blocks = []
+        start_cursor = None
+        while True:
+            kwargs = {'start_cursor': start_cursor} if start_cursor else {}
+            # Slots are held per request, not per subtree, so recursion cannot deadlock
+            async with self.slots:
+                self.stats['requests'] += 1
+                response = await self.gateway.list_children(
+                    block_id, INTERACTIVE, page_size=config.NOTION_PAGE_SIZE, **kwargs
+                )
+            blocks.extend(response['results'])
+            if not response.get('has_more'):
+                return blocks
+            start_cursor = response['next_cursor']
+
+    def _children_source(self, block: Dict) -> str:
+        # A synced block copy keeps its content under the original
+        synced_from = (block.get('synced_block') or {}).get('synced_from') or {}
+        return synced_from.get('block_id', block['id'])
+
+    def _store(self, page_id: str, last_edited_time: str, text: str):
+        self.cache[(page_id, last_edited_time)] = text
+        self.cache.move_to_end((page_id, last_edited_time))
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
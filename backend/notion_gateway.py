@@ -0,0 +1,159 @@
+import asyncio
+import itertools
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from notion_client import AsyncClient
+
+from config import config
+from rate_limiter import TokenBucket, is_rate_limited, retry_after_from
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+NOTION_APPEND_LIMIT = 100  # children per blocks.children.append request
+
+
+class _Request:
+    def __init__(self, priority: int, method: Callable, kwargs: Dict):
+        self.priority = priority
+        self.method = method
+        self.kwargs = kwargs
+        self.future = asyncio.get_running_loop().create_future()
+        self.attempts = 0
+        self.dispatched = False
+        self.lock_key: Optional[str] = None
+
+
+class NotionGateway:
+    """
+    Single path for every Notion call in the process. Requests wait in a
+    priority queue (interactive ahead of background sync, FIFO within a lane)
+    and are released by a token bucket at NOTION_REQUESTS_PER_SECOND, with at
+    most NOTION_MAX_CONCURRENCY in flight. A 429 pauses dispatch for its
+    Retry-After, halves the rate, and puts the request back at the head of its
+    lane; successes creep the rate back up. Appends to the same block that are
+    still queued are merged into one request.
+    """
+
+    def __init__(self, client: AsyncClient = None, rate: float = None):
+        self.client = client or AsyncClient(auth=config.NOTION_TOKEN)
+        rate = rate or config.NOTION_REQUESTS_PER_SECOND
+        self.bucket = TokenBucket(rate * 60, capacity=max(1.0, rate))
+        self.slots = asyncio.Semaphore(config.NOTION_MAX_CONCURRENCY)
+        self.blocked_until = 0.0
+        self._order = itertools.count()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._appends: Dict[str, Dict] = {}
+        self._block_locks: Dict[str, List] = {}  # block id -> [lock, users]
+        self.stats = {'requests': 0, 'rate_limited': 0, 'coalesced_appends': 0}
+
+    async def call(self, method: Callable, priority: int = BACKGROUND, **kwargs) -> Any:
+        request = _Request(priority, method, kwargs)
+        self._enqueue(request)
+        return await request.future
+
+    async def search(self, priority: int = BACKGROUND, **kwargs) -> Dict:
+        return await self.call(self.client.search, priority, **kwargs)
+
+    async def retrieve_page(self, page_id: str, priority: int = INTERACTIVE) -> Dict:
+        return await self.call(self.client.pages.retrieve, priority, page_id=page_id)
+
+    async def update_page(self, page_id: str, priority: int = INTERACTIVE, **kwargs) -> Dict:
+        return await self.call(self.client.pages.update, priority, page_id=page_id, **kwargs)
+
+    async def create_page(self, priority: int = INTERACTIVE, **kwargs) -> Dict:
+        return await self.call(self.client.pages.create, priority, **kwargs)
+
+    async def list_children(self, block_id: str, priority: int = INTERACTIVE, **kwargs) -> Dict:
+        return await self.call(self.client.blocks.children.list, priority, block_id=block_id, **kwargs)
+
+    async def append_children(self, block_id: str, children: List[Dict], priority: int = BACKGROUND) -> Dict:
+        pending = self._appends.get(block_id)
+        if pending is not None and len(pending['children']) + len(children) <= NOTION_APPEND_LIMIT:
+            # Not dispatched yet: ride along with it, taking the higher priority of the two
+            pending['children'].extend(children)
+            self.stats['coalesced_appends'] += 1
+            if priority < pending['request'].priority and not pending['request'].dispatched:
+                pending['request'].priority = priority
+                self._enqueue(pending['request'])
+            return await asyncio.shield(pending['request'].future)
+
+        request = _Request(priority, self.client.blocks.children.append, {'block_id': block_id})
+        request.lock_key = block_id
+        self._appends[block_id] = {'request': request, 'children': list(children)}
+        self._enqueue(request)
+        return await asyncio.shield(request.future)
+
+    def status(self) -> Dict:
+        return {
+            **self.stats,
+            'queued': self._queue.qsize() if self._queue else 0,
+            'rate_per_second': round(self.bucket.rate, 2),
+            'paused_for': max(0.0, round(self.blocked_until - time.monotonic(), 1))
+        }
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    def _enqueue(self, request: _Request):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._queue = asyncio.PriorityQueue()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._queue.put_nowait((request.priority, next(self._order), request))
+
+    async def _dispatch(self):
+        while True:
+            priority, order, request = await self._queue.get()
+            if request.future.done() or request.dispatched or priority != request.priority:
+                # Finished, already taken, or re-queued in a faster lane: this entry is stale
+                continue
+            request.dispatched = True
+
+            delay = self.blocked_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.bucket.acquire()
+            await self.slots.acquire()
+
+            if request.lock_key is not None and self._appends.get(request.lock_key, {}).get('request') is request:
+                # Freeze the merged children; later appends start a new request
+                request.kwargs['children'] = self._appends.pop(request.lock_key)['children']
+            asyncio.create_task(self._execute(request, order))
+
+    async def _execute(self, request: _Request, order: int):
+        entry = None
+        try:
+            if request.lock_key is not None:
+                # Appends to one block must land in the order they were queued
+                entry = self._block_locks.setdefault(request.lock_key, [asyncio.Lock(), 0])
+                entry[1] += 1
+                await entry[0].acquire()
+            request.attempts += 1
+            self.stats['requests'] += 1
+            result = await request.method(**request.kwargs)
+        except Exception as e:
+            if is_rate_limited(e) and request.attempts < config.NOTION_MAX_RETRIES:
+                self.stats['rate_limited'] += 1
+                self.blocked_until = time.monotonic() + (retry_after_from(e) or 1.0)
+                self.bucket.scale(0.5)
+                request.dispatched = False
+                # Same lane, original position: it goes out first once the pause ends
+                self._queue.put_nowait((request.priority, order, request))
+            elif not request.future.done():
+                request.future.set_exception(e)
+            return
+        finally:
+            self.slots.release()
+            if entry is not None:
+                entry[0].release()
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._block_locks[request.lock_key]
+
+        self.bucket.recover()
+        if not request.future.done():
+            request.future.set_result(result)
@@ -7,8 +7,15 @@ from typing import Dict, List
 import firebase_admin
 from firebase_admin import firestore
 from anthropic import AsyncAnthropic
+import time
 import uuid
 from config import config
+from firestore_writer import firestore_writer
+from notion_blocks import BlockTreeFetcher
+from notion_gateway import BACKGROUND, INTERACTIVE, NotionGateway
+from notion_links import LinkIndex
+from redis_store import get_redis
+from sync_scheduler import SyncScheduler, WorkspaceSync
 
 app = FastAPI()
 db = firestore.client()
@@ -17,33 +24,167 @@ anthropic = AsyncAnthropic(api_key=config.ANTHROPIC_API_KEY)
 class NotionSyncEngine:
     def __init__(self, notion_token: str = None):
         token = notion_token or config.NOTION_TOKEN
-        self.notion = AsyncClient(auth=token)
-        self.sync_active = {}
-        
-    async def setup_workspace_sync(self, user_id: str, workspace_id: str):
-        pages = await self.notion.search(
-            filter={"property": "object", "value": "page"}
+        # Every Notion call goes through the gateway's shared rate limit and priority queue
+        self.gateway = NotionGateway(AsyncClient(auth=token))
+        self.scheduler = SyncScheduler(self.sync_workspace)
+        self.bootstrap_slots = asyncio.Semaphore(config.NOTION_BOOTSTRAP_CONCURRENCY)
+        self.bootstraps: Dict[str, asyncio.Task] = {}
+        self.bootstrap_progress: Dict[str, Dict] = {}
+        self.blocks = BlockTreeFetcher(self.gateway)
+        # page_id -> (title, last_edited_time, when we last confirmed it)
+        self.page_versions: Dict[str, tuple] = {}
+        self.links = LinkIndex(
+            db.collection('notion_sync'),
+            redis=get_redis() if config.NOTION_LINKS_REDIS else None
         )
-        
-        for page in pages['results']:
-            page_id = page['id']
-            page_title = self.get_page_title(page)
-            
-            db.collection('notion_sync').document(page_id).set({
+    
+    async def setup_workspace_sync(self, user_id: str, workspace_id: str) -> Dict:
+        """
+        Starts (or resumes) the workspace bootstrap in the background and returns
+        its progress. Delta sync is enabled once every page has been recorded.
+        """
+        key = f"{user_id}_{workspace_id}"
+        task = self.bootstraps.get(key)
+        if task is None or task.done():
+            # Registered before anything is awaited, so a concurrent call joins this bootstrap
+            progress = self.bootstrap_progress[key] = {
                 'user_id': user_id,
                 'workspace_id': workspace_id,
-                'page_title': page_title,
-                'last_sync': firestore.SERVER_TIMESTAMP,
-                'sync_enabled': True
-            })
+                'status': 'queued',
+                'pages_synced': 0,
+                'next_cursor': None,
+                'started_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:00.000Z')
+            }
+            self.bootstraps[key] = asyncio.create_task(self.resume_bootstrap(key, progress))
+        return self.bootstrap_progress[key]
+    
+    async def resume_bootstrap(self, key: str, progress: Dict):
+        try:
+            checkpoint = await self.load_bootstrap_checkpoint(key)
+        except Exception as e:
+            progress['status'] = 'failed'
+            progress['error'] = str(e)
+            print(f"Loading bootstrap checkpoint {key} failed: {e}")
+            return
+        if checkpoint is not None and checkpoint['status'] != 'done':
+            # Continue an interrupted run in place, so callers holding progress see it
+            progress.update(checkpoint)
+        await self.bootstrap_workspace(key, progress)
+    
+    async def bootstrap_workspace(self, key: str, progress: Dict):
+        # Search results are cursor-chained, so the next result page is fetched
+        # while the current one is queued for batched Firestore writes
+        async with self.bootstrap_slots:
+            progress['status'] = 'running'
+            progress.pop('error', None)
+            resuming = progress['next_cursor'] is not None
+            next_page = asyncio.create_task(self.search_pages(progress['next_cursor']))
+            try:
+                while next_page is not None:
+                    try:
+                        response = await next_page
+                    except Exception as e:
+                        if not resuming:
+                            raise
+                        # The saved cursor may have expired: start over, writes are idempotent
+                        print(f"Resuming bootstrap {key} failed, restarting: {e}")
+                        progress['pages_synced'] = 0
+                        response = await self.search_pages(None)
+                    resuming = False
+                    
+                    has_more = response.get('has_more')
+                    next_page = asyncio.create_task(self.search_pages(response['next_cursor'])) if has_more else None
+                    
+                    for page in response['results']:
+                        await firestore_writer.set(db.collection('notion_sync').document(page['id']), {
+                            'user_id': progress['user_id'],
+                            'workspace_id': progress['workspace_id'],
+                            'page_title': self.get_page_title(page),
+                            'last_sync': firestore.SERVER_TIMESTAMP,
+                            'sync_enabled': True
+                        }, merge=True)
+                    
+                    progress['pages_synced'] += len(response['results'])
+                    progress['next_cursor'] = response['next_cursor'] if has_more else None
+                    await self.save_bootstrap_checkpoint(key, progress)
+            except Exception as e:
+                if next_page is not None:
+                    next_page.cancel()
+                progress['status'] = 'failed'
+                progress['error'] = str(e)
+                await self.save_bootstrap_checkpoint(key, progress)
+                print(f"Bootstrap of workspace {progress['workspace_id']} failed: {e}")
+                return
         
-        self.sync_active[user_id] = True
-        asyncio.create_task(self.continuous_sync(user_id, workspace_id))
+        progress['status'] = 'done'
+        await self.save_bootstrap_checkpoint(key, progress)
+        # Edits made while the bootstrap ran are picked up by the first delta sync
+        await self.enable_sync(progress['user_id'], progress['workspace_id'], progress['started_at'])
+    
+    async def search_pages(self, start_cursor: str = None) -> Dict:
+        kwargs = {'start_cursor': start_cursor} if start_cursor else {}
+        return await self.gateway.search(
+            BACKGROUND,
+            filter={"property": "object", "value": "page"},
+            page_size=config.NOTION_PAGE_SIZE,
+            **kwargs
+        )
+    
+    async def load_bootstrap_checkpoint(self, key: str) -> Dict:
+        doc = await asyncio.to_thread(db.collection('notion_bootstrap').document(key).get)
+        return doc.to_dict() if doc.exists else None
+    
+    async def save_bootstrap_checkpoint(self, key: str, progress: Dict):
+        # Queued after the page writes it covers, so it never commits ahead of them
+        await firestore_writer.set(db.collection('notion_bootstrap').document(key), dict(progress))
+    
+    async def enable_sync(self, user_id: str, workspace_id: str, cursor: str = None):
+        workspace = WorkspaceSync(user_id, workspace_id, cursor)
+        self.scheduler.add(workspace)
+        await self.save_sync_cursor(workspace, sync_enabled=True)
+    
+    async def save_sync_cursor(self, workspace: WorkspaceSync, **fields):
+        await firestore_writer.set(db.collection('notion_workspaces').document(workspace.key), {
+            'user_id': workspace.user_id,
+            'workspace_id': workspace.workspace_id,
+            'cursor': workspace.cursor,
+            'seen_at_cursor': sorted(workspace.seen_at_cursor),
+            **fields
+        }, merge=True)
+    
+    async def resume_syncs(self):
+        # Pick up every workspace that was syncing before a restart
+        def load():
+            return db.collection('notion_workspaces').where('sync_enabled', '==', True).get()
+        
+        def load_bootstraps():
+            return db.collection('notion_bootstrap').where('status', 'in', ['queued', 'running']).get()
+        
+        for doc in await asyncio.to_thread(load):
+            data = doc.to_dict()
+            workspace = WorkspaceSync(data['user_id'], data['workspace_id'], data.get('cursor'))
+            workspace.seen_at_cursor = set(data.get('seen_at_cursor', []))
+            self.scheduler.add(workspace)
+        
+        # Interrupted bootstraps continue from their last checkpoint
+        for doc in await asyncio.to_thread(load_bootstraps):
+            data = doc.to_dict()
+            await self.setup_workspace_sync(data['user_id'], data['workspace_id'])
+    
+    def remember_page(self, page: dict):
+        self.page_versions[page['id']] = (self.get_page_title(page), page['last_edited_time'], time.monotonic())
     
     async def task_to_code_branch(self, task_page_id: str):
-        task = await self.notion.pages.retrieve(page_id=task_page_id)
-        task_title = self.get_page_title(task)
-        task_description = await self.get_page_content(task_page_id)
+        # A version confirmed moments ago with its text cached needs no Notion reads at all
+        known = self.page_versions.get(task_page_id)
+        if known and time.monotonic() - known[2] < config.NOTION_PAGE_VERSION_TTL \
+                and self.blocks.cached(task_page_id, known[1]) is not None:
+            task_title, edited = known[0], known[1]
+        else:
+            task = await self.gateway.retrieve_page(task_page_id, INTERACTIVE)
+            self.remember_page(task)
+            task_title, edited = self.get_page_title(task), task['last_edited_time']
+        task_description = await self.blocks.page_text(task_page_id, edited)
         
         prompt = f"""
         Create implementation plan for:
@@ -70,8 +211,9 @@ class NotionSyncEngine:
         plan = json.loads(response.content[0].text)
         branch_id = await self.create_code_branch(plan)
         
-        await self.notion.pages.update(
-            page_id=task_page_id,
+        updated = await self.gateway.update_page(
+            task_page_id,
+            INTERACTIVE,
             properties={
                 "Code Branch": {
                     "url": f"https://nexus.dev/branch/{branch_id}"
@@ -79,7 +221,10 @@ class NotionSyncEngine:
                 "Status": {"status": {"name": "In Progress"}}
             }
         )
-        
+        # Our property edit bumps last_edited_time; the blocks are unchanged
+        self.blocks.rekey(task_page_id, edited, updated['last_edited_time'])
+        self.remember_page(updated)
+
         return plan
     
     async def code_to_notion_docs(self, file_path: str, code_content: str):
@@ -101,7 +246,8 @@ class NotionSyncEngine:
         
         doc_content = json.loads(response.content[0].text)
         
-        page = await self.notion.pages.create(
+        page = await self.gateway.create_page(
+            INTERACTIVE,
             parent={"database_id": self.get_docs_database_id()},
             properties={
                 "Name": {"title": [{"text": {"content": file_path}}]},
@@ -113,28 +259,29 @@ class NotionSyncEngine:
         
         return page['url']
     
-    async def continuous_sync(self, user_id: str, workspace_id: str):
-        while self.sync_active.get(user_id, False):
-            notion_updates = await self.check_notion_updates(user_id)
-            for update in notion_updates:
-                await self.sync_notion_to_code(update)
-            
-            code_updates = await self.check_code_updates(user_id)
-            for update in code_updates:
-                await self.sync_code_to_notion(update)
-            
-            await asyncio.sleep(config.SYNC_INTERVAL)
+    async def sync_workspace(self, workspace: WorkspaceSync) -> int:
+        # Called by the shared scheduler; returns the change count that sets the next interval
+        previous = workspace.cursor
+        notion_updates = await self.check_notion_updates(workspace)
+        for update in notion_updates:
+            await self.sync_notion_to_code(update)
+        
+        code_updates = await self.check_code_updates(workspace.user_id)
+        for update in code_updates:
+            await self.sync_code_to_notion(update)
+        
+        if workspace.cursor != previous or notion_updates:
+            await self.save_sync_cursor(workspace)
+        return len(notion_updates) + len(code_updates)
     
     async def sync_notion_to_code(self, update: dict):
         page_id = update['page_id']
         changes = update['changes']
         
-        sync_record = db.collection('notion_sync').document(page_id).get()
-        if not sync_record.exists:
+        code_file = await self.links.file_for(page_id)
+        if code_file is None:
             return
         
-        code_file = sync_record.to_dict().get('linked_file')
-        
         if changes['type'] == 'task_updated':
             await self.update_code_from_task(code_file, changes)
         elif changes['type'] == 'spec_changed':
@@ -145,29 +292,29 @@ class NotionSyncEngine:
         commit_message = update['commit_message']
         changes = update['changes']
         
-        linked_pages = db.collection('notion_sync')\
-            .where('linked_file', '==', file_path)\
-            .get()
+        linked_pages = await self.links.pages_for(file_path)
+        if not linked_pages:
+            return
         
-        for page_doc in linked_pages:
-            page_id = page_doc.id
-            
-            await self.notion.blocks.children.append(
-                block_id=page_id,
-                children=[{
-                    "object": "block",
-                    "type": "callout",
-                    "callout": {
-                        "rich_text": [{
-                            "type": "text",
-                            "text": {
-                                "content": f"Code updated: {commit_message}\n{changes['summary']}"
-                            }
-                        }],
-                        "icon": {"emoji": "🔄"}
+        callout = {
+            "object": "block",
+            "type": "callout",
+            "callout": {
+                "rich_text": [{
+                    "type": "text",
+                    "text": {
+                        "content": f"Code updated: {commit_message}\n{changes['summary']}"
                     }
-                }]
-            )
+                }],
+                "icon": {"emoji": "🔄"}
+            }
+        }
+        
+        # Queued together; the gateway paces them and merges appends to the same page
+        await asyncio.gather(*(
+            self.gateway.append_children(page_id, [callout], BACKGROUND)
+            for page_id in linked_pages
+        ))
     
     def get_page_title(self, page: dict) -> str:
         properties = page.get('properties', {})
@@ -176,16 +323,9 @@ class NotionSyncEngine:
             return title_prop['title'][0]['text']['content']
         return "Untitled"
     
-    async def get_page_content(self, page_id: str) -> str:
-        blocks = await self.notion.blocks.children.list(block_id=page_id)
-        content = []
-        for block in blocks['results']:
-            if block['type'] == 'paragraph':
-                text = block['paragraph']['rich_text']
-                if text:
-                    content.append(text[0]['text']['content'])
-        return '\n'.join(content)
-    
+    async def get_page_content(self, page_id: str, last_edited_time: str = None) -> str:
+        return await self.blocks.page_text(page_id, last_edited_time)
+
     async def analyze_code(self, code: str) -> dict:
         return {
             'functions': [],
@@ -196,7 +336,7 @@ class NotionSyncEngine:
     
     async def create_code_branch(self, plan: dict) -> str:
         branch_id = str(uuid.uuid4())
-        db.collection('code_branches').document(branch_id).set({
+        await firestore_writer.set(db.collection('code_branches').document(branch_id), {
             'plan': plan,
             'created_at': firestore.SERVER_TIMESTAMP,
             'status': 'created'
@@ -206,8 +346,58 @@ class NotionSyncEngine:
     def get_docs_database_id(self) -> str:
         return config.DOCS_DATABASE_ID
     
-    async def check_notion_updates(self, user_id: str) -> List[dict]:
-        return []
+    async def check_notion_updates(self, workspace: WorkspaceSync) -> List[dict]:
+        """
+        Pages edited since the workspace cursor, newest first. The search stops
+        at the first page older than the cursor, so an idle workspace costs one
+        request.
+        """
+        updates = []
+        start_cursor = None
+        while True:
+            kwargs = {'start_cursor': start_cursor} if start_cursor else {}
+            response = await self.gateway.search(
+                BACKGROUND,
+                filter={"property": "object", "value": "page"},
+                sort={"direction": "descending", "timestamp": "last_edited_time"},
+                page_size=config.NOTION_PAGE_SIZE,
+                **kwargs
+            )
+            
+            reached_cursor = False
+            for page in response['results']:
+                edited = page['last_edited_time']
+                if workspace.cursor and edited < workspace.cursor:
+                    reached_cursor = True
+                    break
+                if edited == workspace.cursor and page['id'] in workspace.seen_at_cursor:
+                    # Pages sharing the cursor minute come back in any order: skip, don't stop
+                    continue
+                self.remember_page(page)
+                updates.append({
+                    'page_id': page['id'],
+                    'last_edited_time': edited,
+                    'changes': {
+                        'type': 'task_updated' if 'Status' in page.get('properties', {}) else 'spec_changed',
+                        'title': self.get_page_title(page)
+                    }
+                })
+            
+            if not workspace.cursor:
+                # No baseline yet (the bootstrap found nothing): start from the newest edit
+                updates = updates[:1]
+                break
+            if reached_cursor or not response.get('has_more'):
+                break
+            start_cursor = response['next_cursor']
+        
+        if not updates:
+            return []
+        newest = updates[0]['last_edited_time']
+        seen = {u['page_id'] for u in updates if u['last_edited_time'] == newest}
+        workspace.seen_at_cursor = seen | (workspace.seen_at_cursor if newest == workspace.cursor else set())
+        baseline, workspace.cursor = workspace.cursor is None, newest
+        return [] if baseline else updates
     
     async def check_code_updates(self, user_id: str) -> List[dict]:
         return []
@@ -220,10 +410,29 @@ class NotionSyncEngine:
 
 notion_engine = NotionSyncEngine("your_notion_token")
 
+@app.on_event("startup")
+async def start_sync_scheduler():
+    await notion_engine.links.start()
+    notion_engine.scheduler.start()
+    await notion_engine.resume_syncs()
+
+@app.on_event("shutdown")
+async def flush_pending_writes():
+    await notion_engine.scheduler.close()
+    await notion_engine.gateway.close()
+    await notion_engine.links.close()
+    await firestore_writer.close()
+
 @app.post("/notion/setup/{user_id}")
 async def setup_notion_sync(user_id: str, workspace_id: str):
-    await notion_engine.setup_workspace_sync(user_id, workspace_id)
-    return {"status": "sync_enabled"}
+    progress = await notion_engine.setup_workspace_sync(user_id, workspace_id)
+    return {"status": "sync_enabled", "bootstrap": progress}
+
+@app.get("/notion/setup/{user_id}/progress")
+async def get_bootstrap_progress(user_id: str, workspace_id: str):
+    key = f"{user_id}_{workspace_id}"
+    progress = notion_engine.bootstrap_progress.get(key) or await notion_engine.load_bootstrap_checkpoint(key)
+    return progress or {"status": "not_started"}
 
 @app.post("/notion/task-to-branch")
 async def convert_task_to_branch(task_page_id: str):
@@ -235,6 +444,18 @@ async def generate_docs_from_code(file_path: str, code_content: str):
     doc_url = await notion_engine.code_to_notion_docs(file_path, code_content)
     return {"doc_url": doc_url}
 
+@app.get("/notion/sync-scheduler")
+async def get_sync_scheduler_status():
+    return notion_engine.scheduler.status()
+
+@app.get("/notion/gateway")
+async def get_gateway_status():
+    return notion_engine.gateway.status()
+
+@app.get("/notion/links")
+async def get_link_index_status():
+    return notion_engine.links.status()
+
 @app.get("/notion/sync-status/{user_id}")
 async def get_sync_status(user_id: str):
     docs = db.collection('notion_sync')\
@@ -0,0 +1,160 @@
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import config
+
+REDIS_KEY = 'notion_links'  # hash of page id -> linked file
+
+
+class LinkIndex:
+    """
+    Code file <-> Notion page links from the notion_sync collection, held in
+    memory in both directions so the sync paths resolve them without a
+    Firestore round-trip. A snapshot listener on the linked documents keeps the
+    index current; its first snapshot replaces whatever was loaded before it.
+    With a Redis client the links are mirrored to the `notion_links` hash, so a
+    restarted worker can serve lookups before that first snapshot arrives.
+    Until the index is ready, lookups fall back to querying Firestore.
+    """
+
+    def __init__(self, collection, redis=None):
+        self.collection = collection
+        self.redis = redis
+        self.page_to_file: Dict[str, str] = {}
+        self.file_to_pages: Dict[str, Set[str]] = {}
+        self.ready = asyncio.Event()
+        self._synced = False
+        self._watch = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._mirror_tasks: Set[asyncio.Task] = set()
+        self._mirror_lock = asyncio.Lock()
+        self.fallback_lookups = 0
+
+    async def pages_for(self, file_path: str) -> List[str]:
+        if self.ready.is_set():
+            return list(self.file_to_pages.get(file_path, ()))
+        self.fallback_lookups += 1
+        docs = await asyncio.to_thread(self.collection.where('linked_file', '==', file_path).get)
+        return [doc.id for doc in docs]
+
+    async def file_for(self, page_id: str) -> Optional[str]:
+        if self.ready.is_set():
+            return self.page_to_file.get(page_id)
+        self.fallback_lookups += 1
+        doc = await asyncio.to_thread(self.collection.document(page_id).get)
+        return (doc.to_dict() or {}).get('linked_file') if doc.exists else None
+
+    def status(self) -> Dict:
+        return {
+            'ready': self.ready.is_set(),
+            'synced': self._synced,
+            'pages': len(self.page_to_file),
+            'files': len(self.file_to_pages),
+            'fallback_lookups': self.fallback_lookups
+        }
+
+    async def start(self):
+        if self._watch is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        if self.redis is not None:
+            await self._load_mirror()
+
+        # Only linked pages are watched; clearing linked_file arrives as a removal
+        query = self.collection.where('linked_file', '>', '')
+        self._watch = query.on_snapshot(self._on_snapshot)
+        try:
+            await asyncio.wait_for(self.ready.wait(), config.NOTION_LINKS_WARM_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Don't hold up startup on the listener; it sets ready whenever it does deliver
+            print(f"Notion link index not ready after {config.NOTION_LINKS_WARM_TIMEOUT}s, "
+                  f"resolving links from Firestore until it is")
+
+    async def close(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+        if self._mirror_tasks:
+            await asyncio.gather(*self._mirror_tasks, return_exceptions=True)
+
+    def _link(self, page_id: str, file_path: str):
+        self._unlink(page_id)
+        self.page_to_file[page_id] = file_path
+        self.file_to_pages.setdefault(file_path, set()).add(page_id)
+
+    def _unlink(self, page_id: str):
+        file_path = self.page_to_file.pop(page_id, None)
+        if file_path is None:
+            return
+        pages = self.file_to_pages.get(file_path)
+        if pages is not None:
+            pages.discard(page_id)
+            if not pages:
+                del self.file_to_pages[file_path]
+
+    def _on_snapshot(self, docs, changes, read_time):
+        # Runs on the Firestore listener thread: copy out plain values, mutate on the loop
+        if not self._synced:
+            links = [(doc.id, (doc.to_dict() or {}).get('linked_file')) for doc in docs]
+            self._loop.call_soon_threadsafe(self._replace, links)
+            return
+        updates = [
+            (change.document.id, None if change.type.name == 'REMOVED'
+             else (change.document.to_dict() or {}).get('linked_file'))
+            for change in changes
+        ]
+        self._loop.call_soon_threadsafe(self._apply, updates)
+
+    def _replace(self, links: List[Tuple[str, Optional[str]]]):
+        self.page_to_file.clear()
+        self.file_to_pages.clear()
+        for page_id, file_path in links:
+            if file_path:
+                self._link(page_id, file_path)
+        self._synced = True
+        self.ready.set()
+        self._mirror(dict(self.page_to_file), replace=True)
+
+    def _apply(self, updates: List[Tuple[str, Optional[str]]]):
+        for page_id, file_path in updates:
+            if file_path:
+                self._link(page_id, file_path)
+            else:
+                self._unlink(page_id)
+        self._mirror(dict(updates))
+
+    def _mirror(self, links: Dict[str, Optional[str]], replace: bool = False):
+        if self.redis is None or not (links or replace):
+            return
+        task = asyncio.create_task(self._write_mirror(links, replace))
+        self._mirror_tasks.add(task)
+        task.add_done_callback(self._mirror_tasks.discard)
+
+    async def _write_mirror(self, links: Dict[str, Optional[str]], replace: bool):
+        linked = {page_id: file_path for page_id, file_path in links.items() if file_path}
+        unlinked = [page_id for page_id, file_path in links.items() if not file_path]
+        try:
+            # Tasks take the lock in creation order, so writes land in snapshot order
+            async with self._mirror_lock, self.redis.pipeline(transaction=True) as pipe:
+                if replace:
+                    pipe.delete(REDIS_KEY)
+                if linked:
+                    pipe.hset(REDIS_KEY, mapping=linked)
+                if unlinked:
+                    pipe.hdel(REDIS_KEY, *unlinked)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Mirroring Notion links to Redis failed: {e}")
+
+    async def _load_mirror(self):
+        try:
+            stored = await self.redis.hgetall(REDIS_KEY)
+        except Exception as e:
+            print(f"Loading Notion links from Redis failed: {e}")
+            return
+        if not stored:
+            return
+        for page_id, file_path in stored.items():
+            self._link(page_id, file_path)
+        # Good enough to serve lookups; the first snapshot corrects any drift
+        self.ready.set()
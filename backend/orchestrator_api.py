@@ -1,25 +1,42 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 from ai_orchestrator import AIOrchestrator
+from firestore_writer import firestore_writer
+from redis_store import close_redis
 import asyncio
+import json
 
 app = FastAPI(title="AI Orchestrator API")
 orchestrator = AIOrchestrator()
 
+@app.on_event("shutdown")
+async def flush_pending_writes():
+    await firestore_writer.close()
+    await close_redis()
+
 class CodeGenerationRequest(BaseModel):
     prompt: str
     user_id: str
     context: Dict = {}
+    use_cache: bool = True
+    timeout: Optional[float] = None  # seconds
 
 class ConsensusRequest(BaseModel):
     question: str
     options: List[str]
+    use_cache: bool = True
+    timeout: Optional[float] = None  # seconds
+    quorum: Optional[float] = None  # vote weight needed to return early
+    weights: Optional[Dict[str, float]] = None  # per model: claude, gpt, gemini
 
 class SpecializedTaskRequest(BaseModel):
     task_type: str  # architect, coder, reviewer, explainer, debugger, optimizer
     prompt: str
     user_id: str
+    use_cache: bool = True
+    timeout: Optional[float] = None  # seconds
 
 @app.post("/orchestrate/collaborative-code")
 async def collaborative_code_generation(request: CodeGenerationRequest):
@@ -30,12 +47,31 @@ async def collaborative_code_generation(request: CodeGenerationRequest):
         result = await orchestrator.collaborative_code_generation(
             request.prompt,
             request.user_id,
-            request.context
+            request.context,
+            request.use_cache,
+            request.timeout
         )
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/orchestrate/collaborative-code/stream")
+async def collaborative_code_generation_stream(request: CodeGenerationRequest):
+    """
+    Streaming variant of the collaborative pipeline (NDJSON, one event per line)
+    """
+    async def event_stream():
+        async for event in orchestrator.collaborative_code_generation_stream(
+            request.prompt,
+            request.user_id,
+            request.context,
+            request.use_cache,
+            request.timeout
+        ):
+            yield json.dumps(event) + "\n"
+    
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
 @app.post("/orchestrate/consensus")
 async def get_consensus(request: ConsensusRequest):
     """
@@ -44,7 +80,11 @@ async def get_consensus(request: ConsensusRequest):
     try:
         result = await orchestrator.consensus_decision(
             request.question,
-            request.options
+            request.options,
+            request.use_cache,
+            request.timeout,
+            request.quorum,
+            request.weights
         )
         return result
     except Exception as e:
@@ -67,7 +107,9 @@ async def specialized_task(request: SpecializedTaskRequest):
         result = await orchestrator.specialized_task(
             request.task_type,
             request.prompt,
-            request.user_id
+            request.user_id,
+            request.use_cache,
+            request.timeout
         )
         return result
     except Exception as e:
@@ -80,9 +122,31 @@ async def get_model_roles():
     """
     return {
         "model_roles": orchestrator.model_roles,
+        "model_fallbacks": orchestrator.model_fallbacks,
         "available_tasks": list(orchestrator.model_roles.keys())
     }
 
+@app.get("/orchestrate/models/status")
+async def get_models_status():
+    """
+    Get live circuit breaker state and rolling latency per model
+    """
+    return await orchestrator.get_models_status()
+
+@app.get("/orchestrate/cache/stats")
+async def get_cache_stats():
+    """
+    Get LLM response cache hit/miss counters
+    """
+    return orchestrator.get_cache_stats()
+
+@app.get("/orchestrate/rate-limits")
+async def get_rate_limits():
+    """
+    Get current adaptive rate limits per provider and model
+    """
+    return orchestrator.get_rate_limit_status()
+
 @app.get("/orchestrate/history/{user_id}")
 async def get_collaboration_history(user_id: str, limit: int = 10):
     """
@@ -112,7 +176,10 @@ async def batch_processing(requests: List[SpecializedTaskRequest]):
     """
     try:
         tasks = [
-            orchestrator.specialized_task(req.task_type, req.prompt, req.user_id)
+            # Items queue behind the rate limiter; only an explicit per-item timeout bounds them
+            orchestrator.specialized_task(
+                req.task_type, req.prompt, req.user_id, req.use_cache, req.timeout, default_deadline=False
+            )
             for req in requests
         ]
         
@@ -0,0 +1,88 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+
+StageFunc = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+# Keep references to background stages so they are not garbage collected mid-flight
+_background_tasks: Set[asyncio.Task] = set()
+
+
+class Stage:
+    def __init__(self, name: str, func: StageFunc, deps: Iterable[str] = (), background: bool = False):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.background = background
+
+
+class StageGraph:
+    """
+    Dependency graph of async stages. Each stage starts as soon as all of its
+    dependencies have produced a result and receives those results as a dict.
+    Background stages run off the critical path: run() does not wait for them
+    and nothing may depend on them.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Stage] = {}
+
+    def add(self, name: str, func: StageFunc, deps: Iterable[str] = (), background: bool = False) -> 'StageGraph':
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+
+        deps = tuple(deps)
+        for dep in deps:
+            # Requiring deps to be declared first keeps the graph acyclic
+            if dep not in self.stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+            if self.stages[dep].background:
+                raise ValueError(f"Stage '{name}' cannot depend on background stage '{dep}'")
+
+        self.stages[name] = Stage(name, func, deps, background)
+        return self
+
+    async def run(self, on_complete: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+        results: Dict[str, Any] = {}
+        started: Set[str] = set()
+        pending: Dict[asyncio.Task, Stage] = {}
+
+        def start_ready():
+            for stage in self.stages.values():
+                if stage.name in started or not all(dep in results for dep in stage.deps):
+                    continue
+
+                started.add(stage.name)
+                inputs = {dep: results[dep] for dep in stage.deps}
+                task = asyncio.create_task(stage.func(inputs))
+
+                if stage.background:
+                    _background_tasks.add(task)
+                    task.add_done_callback(_background_done(stage.name))
+                else:
+                    pending[task] = stage
+
+        start_ready()
+
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stage = pending.pop(task)
+                    results[stage.name] = task.result()
+                    if on_complete:
+                        on_complete(stage.name, results[stage.name])
+                start_ready()
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
+
+        return results
+
+
+def _background_done(name: str):
+    def callback(task: asyncio.Task):
+        _background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"Background stage '{name}' failed: {task.exception()}")
+    return callback
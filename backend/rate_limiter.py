@@ -0,0 +1,168 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from config import config
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.base_rate = per_minute / 60.0
+        self.rate = self.base_rate
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        # Waiters queue on the lock, so the bucket is drained in FIFO order
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def scale(self, factor: float, floor: float = 0.05):
+        self.rate = min(self.base_rate, max(self.base_rate * floor, self.rate * factor))
+
+    def recover(self, step: float = 0.05):
+        self.rate = min(self.base_rate, self.rate + self.base_rate * step)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class Limit:
+    """
+    Requests/min and tokens/min buckets plus a concurrency cap for one provider
+    or model. A 429 halves both rates and pauses new requests until Retry-After
+    has elapsed; each success then creeps the rates back towards the configured limit.
+    """
+
+    def __init__(self, name: str, rpm: int, tpm: int, concurrency: int):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.blocked_until = 0.0
+        self.rate_limited = 0
+
+    async def acquire(self, tokens: int):
+        delay = self.blocked_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+    def on_rate_limited(self, retry_after: Optional[float]):
+        self.rate_limited += 1
+        self.requests.scale(0.5)
+        self.tokens.scale(0.5)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def on_success(self):
+        self.requests.recover()
+        self.tokens.recover()
+
+    def status(self) -> Dict:
+        return {
+            'requests_per_minute': round(self.requests.rate * 60, 2),
+            'tokens_per_minute': round(self.tokens.rate * 60, 2),
+            'rate_limited': self.rate_limited,
+            'blocked_for': max(0.0, round(self.blocked_until - time.monotonic(), 2))
+        }
+
+
+class RateLimiter:
+    def __init__(self, provider_limits: Dict[str, Dict] = None, model_limits: Dict[str, Dict] = None):
+        if provider_limits is None:
+            provider_limits = config.PROVIDER_RATE_LIMITS
+        if model_limits is None:
+            model_limits = config.MODEL_RATE_LIMITS
+
+        self.provider_limits = {
+            name: Limit(name, **limits)
+            for name, limits in provider_limits.items()
+        }
+        self.model_limits = {
+            name: Limit(name, **limits)
+            for name, limits in model_limits.items()
+        }
+
+    @asynccontextmanager
+    async def slot(self, provider: str, model: str, tokens: int):
+        limits = self._limits_for(provider, model)
+
+        # Semaphores are always taken provider-first so two callers cannot deadlock
+        acquired = []
+        try:
+            for limit in limits:
+                await limit.semaphore.acquire()
+                acquired.append(limit)
+            for limit in limits:
+                await limit.acquire(tokens)
+            yield
+        except Exception as e:
+            if is_rate_limited(e):
+                retry_after = retry_after_from(e)
+                for limit in limits:
+                    limit.on_rate_limited(retry_after)
+            raise
+        else:
+            for limit in limits:
+                limit.on_success()
+        finally:
+            for limit in acquired:
+                limit.semaphore.release()
+
+    def status(self) -> Dict:
+        return {
+            'providers': {name: limit.status() for name, limit in self.provider_limits.items()},
+            'models': {name: limit.status() for name, limit in self.model_limits.items()}
+        }
+
+    def _limits_for(self, provider: str, model: str) -> List[Limit]:
+        limits = []
+        if provider in self.provider_limits:
+            limits.append(self.provider_limits[provider])
+        if model in self.model_limits:
+            limits.append(self.model_limits[model])
+        return limits
+
+
+def estimate_tokens(messages: List[Dict], max_tokens: Optional[int]) -> int:
+    # ~4 characters per token is close enough for budgeting purposes
+    prompt_chars = sum(len(str(m.get('content', ''))) for m in messages)
+    return prompt_chars // 4 + (max_tokens or config.DEFAULT_COMPLETION_TOKENS)
+
+
+def status_code_of(exc: Exception) -> Optional[int]:
+    for source in (exc, getattr(exc, 'response', None)):
+        code = getattr(source, 'status_code', None) or getattr(source, 'status', None)
+        if isinstance(code, int):
+            return code
+    # google.api_core exceptions expose the HTTP status as .code
+    code = getattr(exc, 'code', None)
+    return code if isinstance(code, int) else None
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    return status_code_of(exc) == 429 or 'RateLimit' in type(exc).__name__
+
+
+def retry_after_from(exc: Exception) -> Optional[float]:
+    headers = getattr(getattr(exc, 'response', None), 'headers', None) or getattr(exc, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after') or headers.get('Retry-After')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
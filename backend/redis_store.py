@@ -0,0 +1,101 @@
+import json
+from typing import Dict, List, Optional
+
+import redis.asyncio as aioredis
+
+from config import config
+
+_pool: Optional[aioredis.ConnectionPool] = None
+
+
+def get_redis() -> aioredis.Redis:
+    """
+    Async Redis client on the process-wide connection pool. Clients are cheap;
+    the pool is what holds the sockets.
+    """
+    global _pool
+    if _pool is None:
+        _pool = aioredis.ConnectionPool.from_url(
+            config.REDIS_URL,
+            max_connections=config.REDIS_MAX_CONNECTIONS,
+            decode_responses=True
+        )
+    return aioredis.Redis(connection_pool=_pool)
+
+
+async def close_redis():
+    global _pool
+    if _pool is not None:
+        await _pool.disconnect()
+        _pool = None
+
+
+class JsonRepository:
+    """
+    JSON documents stored under `<prefix>:<id>`, optionally indexed per user in
+    the `<index>:<user_id>` set. The document and its index entry are written in
+    one pipelined round-trip.
+    """
+
+    prefix = ''
+    index = None
+
+    def __init__(self, redis: aioredis.Redis = None):
+        self.redis = redis or get_redis()
+
+    def key(self, item_id: str) -> str:
+        return f"{self.prefix}:{item_id}"
+
+    async def get(self, item_id: str) -> Optional[Dict]:
+        data = await self.redis.get(self.key(item_id))
+        return json.loads(data) if data else None
+
+    async def save(self, item_id: str, data: Dict, user_id: str = None):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(self.key(item_id), json.dumps(data))
+            if self.index and user_id:
+                pipe.sadd(f"{self.index}:{user_id}", item_id)
+            await pipe.execute()
+
+    async def get_many(self, item_ids: List[str]) -> List[Optional[Dict]]:
+        if not item_ids:
+            return []
+        values = await self.redis.mget([self.key(item_id) for item_id in item_ids])
+        return [json.loads(v) if v else None for v in values]
+
+    async def for_user(self, user_id: str) -> List[Dict]:
+        if not self.index:
+            return []
+        item_ids = sorted(await self.redis.smembers(f"{self.index}:{user_id}"))
+        return [item for item in await self.get_many(item_ids) if item is not None]
+
+
+class DeploymentRepository(JsonRepository):
+    prefix = 'deployment'
+    index = 'user_deployments'
+
+
+class DatabaseConnectionRepository(JsonRepository):
+    prefix = 'db_connection'
+    index = 'user_db_connections'
+
+
+class GameRepository(JsonRepository):
+    prefix = 'game'
+    index = 'user_games'
+
+
+class MobileAppRepository(JsonRepository):
+    prefix = 'mobile_app'
+    index = 'user_mobile_apps'
+
+
+class PluginRepository:
+    def __init__(self, redis: aioredis.Redis = None):
+        self.redis = redis or get_redis()
+
+    async def install(self, user_id: str, plugin_id: str):
+        await self.redis.sadd(f"user_plugins:{user_id}", plugin_id)
+
+    async def installed(self, user_id: str) -> List[str]:
+        return sorted(await self.redis.smembers(f"user_plugins:{user_id}"))
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from config import config
+
+
+def cache_key(provider: str, model: str, messages: List[Dict], max_tokens: Optional[int] = None,
+              response_format: Optional[Dict] = None) -> str:
+    payload = json.dumps({
+        'provider': provider,
+        'model': model,
+        'messages': messages,
+        'max_tokens': max_tokens,
+        'response_format': response_format
+    }, sort_keys=True, separators=(',', ':'))
+    return 'llm_cache:' + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM completions: an in-process LRU bounded by entry count
+    and total size, backed by Redis so entries survive restarts and are shared
+    between workers. Redis errors are counted and otherwise treated as misses.
+    """
+
+    def __init__(self, ttl: int = None, max_entries: int = None, max_bytes: int = None,
+                 redis_client: Optional[aioredis.Redis] = None):
+        self.ttl = ttl or config.LLM_CACHE_TTL
+        self.max_entries = max_entries or config.LLM_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or config.LLM_CACHE_MAX_BYTES
+        self.redis = redis_client
+
+        self._entries: 'OrderedDict[str, Tuple[float, str, int]]' = OrderedDict()
+        self._bytes = 0
+        self.stats = {
+            'memory_hits': 0,
+            'redis_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'redis_errors': 0
+        }
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value, _ = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return value
+            self._discard(key)
+
+        if self.redis is not None:
+            try:
+                value = await self.redis.get(key)
+            except Exception:
+                self.stats['redis_errors'] += 1
+                value = None
+            if value is not None:
+                self.stats['redis_hits'] += 1
+                self._store_local(key, value)
+                return value
+
+        self.stats['misses'] += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        self._store_local(key, value)
+
+        if self.redis is not None:
+            try:
+                await self.redis.set(key, value, ex=self.ttl)
+            except Exception:
+                self.stats['redis_errors'] += 1
+
+    def get_stats(self) -> Dict:
+        lookups = self.stats['memory_hits'] + self.stats['redis_hits'] + self.stats['misses']
+        hits = lookups - self.stats['misses']
+        return {
+            **self.stats,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hit_rate': hits / lookups if lookups else 0.0
+        }
+
+    def _store_local(self, key: str, value: str):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        self._discard(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value, size)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.stats['evictions'] += 1
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional
+
+from config import config
+from rate_limiter import is_rate_limited, retry_after_from, status_code_of
+
+TRANSIENT_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+TRANSIENT_ERROR_NAMES = {
+    'APIConnectionError', 'APITimeoutError', 'InternalServerError', 'ServiceUnavailable',
+    'DeadlineExceeded', 'ResourceExhausted', 'OverloadedError'
+}
+
+# Absolute (monotonic) deadline of the request currently being served. Context
+# variables are copied into tasks, so stages spawned by a pipeline inherit it.
+_deadline: ContextVar[Optional[float]] = ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """
+    Bound everything awaited inside the block to `seconds`. Nested scopes can only
+    tighten an outer deadline, never extend it.
+    """
+    current = _deadline.get()
+    deadline = current
+    if seconds:
+        deadline = time.monotonic() + seconds
+        if current is not None:
+            deadline = min(current, deadline)
+
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, (json.JSONDecodeError, DeadlineExceeded)):
+        return False
+    code = status_code_of(exc)
+    if code is not None:
+        return code in TRANSIENT_STATUS_CODES
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    return type(exc).__name__ in TRANSIENT_ERROR_NAMES
+
+
+class RetryPolicy:
+    """
+    Retries transient failures with full-jitter exponential backoff inside the
+    current deadline. When hedge_after is given, a second copy of a slow attempt
+    is started after that many seconds and whichever finishes first wins.
+    """
+
+    def __init__(self, max_attempts: int = None, base_delay: float = None, max_delay: float = None):
+        self.max_attempts = max_attempts or config.RETRY_MAX_ATTEMPTS
+        self.base_delay = base_delay or config.RETRY_BASE_DELAY
+        self.max_delay = max_delay or config.RETRY_MAX_DELAY
+        self.stats = {'retries': 0, 'hedged': 0, 'hedge_wins': 0, 'deadline_exceeded': 0}
+
+    async def call(self, attempt: Callable[[], Awaitable[Any]], hedge_after: Optional[float] = None) -> Any:
+        for attempt_number in range(self.max_attempts):
+            try:
+                return await self._attempt(attempt, hedge_after)
+            except Exception as e:
+                if not is_transient(e) or attempt_number == self.max_attempts - 1:
+                    raise
+
+                delay = self.backoff(attempt_number)
+                if is_rate_limited(e):
+                    delay = retry_after_from(e) or delay
+
+                budget = remaining()
+                if budget is not None and delay >= budget:
+                    raise
+
+                self.stats['retries'] += 1
+                await asyncio.sleep(delay)
+
+    def backoff(self, attempt_number: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt_number)))
+
+    async def _attempt(self, attempt: Callable[[], Awaitable[Any]], hedge_after: Optional[float]) -> Any:
+        budget = remaining()
+        if budget == 0:
+            self.stats['deadline_exceeded'] += 1
+            raise DeadlineExceeded("Request deadline exceeded")
+
+        primary = asyncio.ensure_future(attempt())
+        pending = {primary}
+        error = None
+
+        try:
+            if hedge_after is not None and (budget is None or hedge_after < budget):
+                done, _ = await asyncio.wait(pending, timeout=hedge_after)
+                if not done:
+                    self.stats['hedged'] += 1
+                    pending.add(asyncio.ensure_future(attempt()))
+
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining(), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.stats['deadline_exceeded'] += 1
+                    raise DeadlineExceeded("Request deadline exceeded")
+
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.stats['hedge_wins'] += 1
+                        return task.result()
+                    error = task.exception()
+
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
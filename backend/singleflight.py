@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one in-flight task.
+    Every waiter gets the same result (or exception). The shared task is
+    shielded, so a waiter disconnecting does not cancel it for the others;
+    once the last waiter is gone it is cancelled, since nobody is left to
+    pay for. A caller that wants the work finished regardless (to fill a
+    cache, say) has to stay waiting on it.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, _Flight] = {}
+        self.stats = {'calls': 0, 'shared': 0, 'abandoned': 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda t: self._forget(key, flight))
+            self.stats['calls'] += 1
+        else:
+            self.stats['shared'] += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # Unlist it first so a new caller starts fresh instead of joining a cancelled task
+                self._forget(key, flight)
+                flight.task.cancel()
+                self.stats['abandoned'] += 1
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        # Retrieve the exception so an unawaited failure is not logged as never retrieved
+        if flight.task.done() and not flight.task.cancelled():
+            flight.task.exception()
@@ -0,0 +1,134 @@
+import asyncio
+import heapq
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from config import config
+
+
+class WorkspaceSync:
+    """
+    Sync state for one (user, workspace): the last_edited_time high-water mark
+    already synced (with the pages seen at exactly that time, since Notion
+    timestamps are coarse) and the current poll interval.
+    """
+
+    def __init__(self, user_id: str, workspace_id: str, cursor: str = None):
+        self.user_id = user_id
+        self.workspace_id = workspace_id
+        self.cursor = cursor
+        self.seen_at_cursor: Set[str] = set()
+        self.running = False
+        self.interval = float(config.SYNC_INTERVAL)
+        self.next_run = time.monotonic()
+        self.runs = 0
+        self.changes = 0
+
+    @property
+    def key(self) -> str:
+        return f"{self.user_id}_{self.workspace_id}"
+
+    def reschedule(self, changed: int):
+        # Busy workspaces are polled more often, idle ones back off
+        if changed:
+            self.interval = max(config.SYNC_MIN_INTERVAL, self.interval / 2)
+        else:
+            self.interval = min(config.SYNC_MAX_INTERVAL, self.interval * config.SYNC_BACKOFF)
+        self.next_run = time.monotonic() + self.interval
+
+
+class SyncScheduler:
+    """
+    One scheduler for every synced workspace instead of a sleeping task per user.
+    Workspaces wait in a heap ordered by next run; a dispatcher hands due ones to
+    a fixed pool of SYNC_WORKERS, which call sync(workspace) -> number of changes
+    and reschedule it by that count. A workspace is never synced twice at once.
+    """
+
+    def __init__(self, sync: Callable[[WorkspaceSync], Awaitable[int]], workers: int = None):
+        self.sync = sync
+        self.workers = workers or config.SYNC_WORKERS
+        self.workspaces: Dict[str, WorkspaceSync] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._due: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def add(self, workspace: WorkspaceSync):
+        if workspace.key in self.workspaces:
+            return
+        self.workspaces[workspace.key] = workspace
+        workspace.next_run = time.monotonic()
+        self._push(workspace)
+
+    def remove(self, key: str):
+        # Heap entries for removed workspaces are skipped when they come due
+        self.workspaces.pop(key, None)
+
+    def status(self) -> Dict:
+        return {
+            key: {
+                'interval': round(ws.interval, 1),
+                'cursor': ws.cursor,
+                'runs': ws.runs,
+                'changes': ws.changes
+            }
+            for key, ws in self.workspaces.items()
+        }
+
+    def start(self):
+        if self._tasks:
+            return
+        self._due = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._dispatch())]
+        self._tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        for key, ws in self.workspaces.items():
+            heapq.heappush(self._heap, (ws.next_run, key))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._heap = []
+
+    def _push(self, workspace: WorkspaceSync):
+        if not self._tasks:
+            return
+        heapq.heappush(self._heap, (workspace.next_run, workspace.key))
+        self._wakeup.set()
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                run_at, key = heapq.heappop(self._heap)
+                workspace = self.workspaces.get(key)
+                # Stale entry: removed, or re-added with a different schedule
+                if workspace is not None and workspace.next_run == run_at and not workspace.running:
+                    self._due.put_nowait(workspace)
+
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self):
+        while True:
+            workspace = await self._due.get()
+            workspace.running = True
+            try:
+                changed = await self.sync(workspace)
+            except Exception as e:
+                print(f"Sync of workspace {workspace.workspace_id} for {workspace.user_id} failed: {e}")
+                changed = 0
+            finally:
+                workspace.running = False
+            workspace.runs += 1
+            workspace.changes += changed
+            if workspace.key in self.workspaces:
+                workspace.reschedule(changed)
+                self._push(workspace)
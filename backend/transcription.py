@@ -0,0 +1,312 @@
+import asyncio
+import importlib.util
+import io
+import json
+import math
+import os
+import tempfile
+import threading
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import assemblyai as aai
+
+from config import config
+
+
+class Transcript:
+    def __init__(self, text: str, confidence: float = 0.0, final: bool = True):
+        self.text = text
+        self.confidence = confidence
+        self.final = final
+
+
+OnTranscript = Callable[[Transcript], None]
+
+
+class AssemblyAIBackend:
+    """
+    The hosted service: realtime streaming and file transcription.
+    """
+
+    name = 'assemblyai'
+
+    def __init__(self):
+        aai.settings.api_key = config.ASSEMBLYAI_API_KEY
+
+    def realtime(self, sample_rate: int, on_data: OnTranscript):
+        def forward(transcript: aai.RealtimeTranscript):
+            final = isinstance(transcript, aai.RealtimeFinalTranscript)
+            on_data(Transcript(transcript.text, transcript.confidence, final))
+
+        return aai.RealtimeTranscriber(
+            sample_rate=sample_rate,
+            on_data=forward,
+            on_error=lambda error: print(f"Realtime transcription error: {error}")
+        )
+
+    async def transcribe(self, audio: bytes) -> Dict:
+        def run():
+            with tempfile.NamedTemporaryFile(delete=False) as f:
+                f.write(audio)
+            try:
+                transcript = aai.Transcriber().transcribe(f.name)
+            finally:
+                os.unlink(f.name)
+            return {'text': transcript.text or '', 'confidence': transcript.confidence or 0.0}
+
+        return await asyncio.to_thread(run)
+
+    def close(self):
+        pass
+
+
+# Local decoding runs in worker processes; each loads the model once
+_model = None
+
+
+def _load_model(model_size: str, device: str, compute_type: str):
+    global _model
+    from faster_whisper import WhisperModel
+    _model = WhisperModel(model_size, device=device, compute_type=compute_type)
+
+
+def _decode(audio: bytes, sample_rate: Optional[int]) -> Dict:
+    import numpy as np
+
+    if sample_rate:
+        # Raw 16-bit PCM from a realtime stream
+        source = np.frombuffer(audio[:len(audio) // 2 * 2], dtype=np.int16).astype(np.float32) / 32768.0
+    else:
+        # An uploaded file in whatever container it came in
+        source = io.BytesIO(audio)
+
+    segments = list(_model.transcribe(source, beam_size=1)[0])
+    text = ' '.join(segment.text.strip() for segment in segments).strip()
+    confidence = math.exp(sum(s.avg_logprob for s in segments) / len(segments)) if segments else 0.0
+    return {'text': text, 'confidence': round(confidence, 3)}
+
+
+def _rms(frame: bytes) -> float:
+    samples = array('h', frame[:len(frame) // 2 * 2])
+    return math.sqrt(sum(s * s for s in samples) / len(samples)) if samples else 0.0
+
+
+class LocalBackend:
+    """
+    CPU decoding with faster-whisper in a process pool, so concurrent streams
+    and uploads spread across cores instead of contending for the GIL.
+    """
+
+    name = 'local'
+
+    def __init__(self):
+        if importlib.util.find_spec('faster_whisper') is None:
+            raise RuntimeError("TRANSCRIPTION_BACKEND=local needs the faster-whisper package")
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=config.TRANSCRIPTION_WORKERS,
+                initializer=_load_model,
+                initargs=(config.TRANSCRIPTION_MODEL, config.TRANSCRIPTION_DEVICE, config.TRANSCRIPTION_COMPUTE_TYPE)
+            )
+        return self._pool
+
+    def realtime(self, sample_rate: int, on_data: OnTranscript):
+        return LocalRealtimeTranscriber(self, sample_rate, on_data)
+
+    async def transcribe(self, audio: bytes) -> Dict:
+        return await asyncio.wrap_future(self.pool().submit(_decode, audio, None))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class LocalRealtimeTranscriber:
+    """
+    Realtime facade over the local decoder. Leading silence is dropped; while
+    speech accumulates, the utterance so far is re-decoded every
+    TRANSCRIPTION_PARTIAL_SECONDS as a partial, and TRANSCRIPTION_SILENCE_MS of
+    quiet (or TRANSCRIPTION_MAX_UTTERANCE_SECONDS of audio) ends it with a final.
+    A partial is skipped while the previous one is still decoding, so stale
+    partials never queue ahead of finals in the pool. Partials that finish after
+    a newer result, or while an earlier final is still decoding, are discarded.
+    Finals can finish out of order across pool workers, so one that finishes
+    early is held back until every earlier final has been delivered.
+    """
+
+    def __init__(self, backend: LocalBackend, sample_rate: int, on_data: OnTranscript):
+        self.backend = backend
+        self.sample_rate = sample_rate
+        self.on_data = on_data
+        self.bytes_per_second = sample_rate * config.VOICE_SAMPLE_WIDTH
+        self.pcm = bytearray()
+        self.silent_bytes = 0
+        self.partial_at = 0
+        self.sequence = 0
+        self.delivered = -1
+        self.finals = 0
+        self.next_final = 0
+        self._held: Dict[int, Optional[Transcript]] = {}
+        self._partial: Optional[Future] = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        pass
+
+    def stream(self, frame: bytes):
+        silent = _rms(frame) < config.TRANSCRIPTION_SILENCE_RMS
+        if silent and not self.pcm:
+            return
+        self.pcm += frame
+        self.silent_bytes = self.silent_bytes + len(frame) if silent else 0
+
+        if (self.silent_bytes >= config.TRANSCRIPTION_SILENCE_MS * self.bytes_per_second // 1000
+                or len(self.pcm) >= config.TRANSCRIPTION_MAX_UTTERANCE_SECONDS * self.bytes_per_second):
+            self._submit(final=True)
+        elif len(self.pcm) - self.partial_at >= config.TRANSCRIPTION_PARTIAL_SECONDS * self.bytes_per_second \
+                and (self._partial is None or self._partial.done()):
+            self._submit(final=False)
+
+    def close(self):
+        if self.pcm:
+            self._submit(final=True)
+
+    def _submit(self, final: bool):
+        sequence = self.sequence
+        self.sequence += 1
+        future = self.backend.pool().submit(_decode, bytes(self.pcm), self.sample_rate)
+        if final:
+            index = self.finals
+            self.finals += 1
+            future.add_done_callback(lambda f: self._deliver_final(f, sequence, index))
+            self.pcm.clear()
+            self.silent_bytes = 0
+            self.partial_at = 0
+        else:
+            future.add_done_callback(lambda f: self._deliver_partial(f, sequence))
+            self._partial = future
+            self.partial_at = len(self.pcm)
+
+    def _deliver_partial(self, future: Future, sequence: int):
+        transcript = _transcript(future, final=False)
+        with self._lock:
+            # A partial ahead of an undelivered final would reorder the utterances
+            if transcript is None or sequence < self.delivered or self.next_final < self.finals:
+                return
+            self.delivered = sequence
+            self.on_data(transcript)
+
+    def _deliver_final(self, future: Future, sequence: int, index: int):
+        # A failed or empty final still takes its turn, or every later one would wait on it
+        transcript = _transcript(future, final=True)
+        with self._lock:
+            self._held[index] = transcript
+            self.delivered = max(self.delivered, sequence)
+            while self.next_final in self._held:
+                transcript = self._held.pop(self.next_final)
+                self.next_final += 1
+                if transcript is not None:
+                    self.on_data(transcript)
+
+
+def _transcript(future: Future, final: bool) -> Optional[Transcript]:
+    if future.cancelled():
+        return None
+    if future.exception() is not None:
+        print(f"Local transcription failed: {future.exception()}")
+        return None
+    result = future.result()
+    return Transcript(result['text'], result['confidence'], final) if result['text'] else None
+
+
+DEFAULT_REPLAY_SCRIPT = [
+    {'text': 'Create a function that validates email addresses', 'confidence': 0.93},
+    {'text': 'Run the tests', 'confidence': 0.97},
+    {'text': 'Explain what this function does', 'confidence': 0.9},
+]
+
+
+class ReplayBackend:
+    """
+    Deterministic stand-in for load tests: plays a script of utterances (JSON
+    lines of {"text", "confidence"} at TRANSCRIPTION_REPLAY_PATH, or a built-in
+    list) in order. Each realtime stream walks the script from the start on its
+    own, emitting one word-by-word partial per frame and a final every
+    TRANSCRIPTION_REPLAY_UTTERANCE_SECONDS of audio, so results depend only on
+    how much audio that stream sent, never on timing or on other sessions.
+    """
+
+    name = 'replay'
+
+    def __init__(self):
+        self.script = self._load_script()
+        self.position = 0
+
+    def _load_script(self) -> List[Dict]:
+        if not config.TRANSCRIPTION_REPLAY_PATH:
+            return DEFAULT_REPLAY_SCRIPT
+        with open(config.TRANSCRIPTION_REPLAY_PATH) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def utterance(self, index: int) -> Dict:
+        return self.script[index % len(self.script)]
+
+    def realtime(self, sample_rate: int, on_data: OnTranscript):
+        return ReplayRealtimeTranscriber(self, sample_rate, on_data)
+
+    async def transcribe(self, audio: bytes) -> Dict:
+        # Runs on the event loop, so the shared position needs no lock
+        utterance = self.utterance(self.position)
+        self.position += 1
+        return {'text': utterance['text'], 'confidence': utterance.get('confidence', 1.0)}
+
+    def close(self):
+        pass
+
+
+class ReplayRealtimeTranscriber:
+    def __init__(self, backend: ReplayBackend, sample_rate: int, on_data: OnTranscript):
+        self.backend = backend
+        self.on_data = on_data
+        self.utterance_bytes = int(
+            config.TRANSCRIPTION_REPLAY_UTTERANCE_SECONDS * sample_rate * config.VOICE_SAMPLE_WIDTH
+        )
+        self.received = 0
+        self.position = 0
+        self.utterance: Optional[Dict] = None
+
+    def connect(self):
+        pass
+
+    def stream(self, frame: bytes):
+        if self.utterance is None:
+            self.utterance = self.backend.utterance(self.position)
+            self.position += 1
+        self.received += len(frame)
+
+        words = self.utterance['text'].split()
+        confidence = self.utterance.get('confidence', 1.0)
+        if self.received >= self.utterance_bytes:
+            self.on_data(Transcript(self.utterance['text'], confidence, final=True))
+            self.utterance = None
+            self.received = 0
+        else:
+            spoken = max(1, len(words) * self.received // self.utterance_bytes)
+            self.on_data(Transcript(' '.join(words[:spoken]).lower(), confidence, final=False))
+
+    def close(self):
+        pass
+
+
+def create_transcription_backend():
+    if config.TRANSCRIPTION_BACKEND == 'local':
+        return LocalBackend()
+    if config.TRANSCRIPTION_BACKEND == 'replay':
+        return ReplayBackend()
+    return AssemblyAIBackend()
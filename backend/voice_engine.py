@@ -1,15 +1,22 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 import asyncio
 import json
-import assemblyai as aai
 from anthropic import AsyncAnthropic
 import firebase_admin
 from firebase_admin import credentials, firestore
 from datetime import datetime
-from typing import List, Dict
+from typing import Awaitable, Callable, Dict, Optional, Set
+import concurrent.futures
+import re
 import uuid
 
 from config import config
+from firestore_writer import firestore_writer
+from audio_ingest import AudioRingBuffer
+from intent_classifier import IntentClassifier
+from transcription import Transcript, create_transcription_backend
+from redis_store import close_redis, get_redis
+from voice_session import VoiceSession
 
 # Initialize Firebase
 try:
@@ -21,36 +28,134 @@ except Exception as e:
     db = None
 
 # Initialize AI clients
-aai.settings.api_key = config.ASSEMBLYAI_API_KEY
 anthropic = AsyncAnthropic(api_key=config.ANTHROPIC_API_KEY)
 
 app = FastAPI()
 
+def normalize_utterance(text: str) -> str:
+    # Partials arrive unpunctuated and lower-case, finals formatted; compare words only
+    return ' '.join(re.sub(r"[^\w\s']", ' ', text.lower()).split())
+
+class IntentSpeculator:
+    """
+    Starts intent detection on partial transcripts so it overlaps with the user
+    still speaking. A partial whose words differ from the running guess cancels
+    it and starts a new one; the final transcript reuses the guess when the words
+    match and only falls back to a fresh detect_intent call when they do not.
+    """
+    
+    def __init__(self, engine: 'VoiceCommandEngine', session: VoiceSession):
+        self.engine = engine
+        self.session = session
+        self.text: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {'started': 0, 'hits': 0, 'misses': 0}
+    
+    def speculate(self, text: str):
+        key = normalize_utterance(text)
+        if key == self.text or len(key.split()) < config.VOICE_SPECULATION_MIN_WORDS:
+            return
+        self.cancel()
+        self.text = key
+        self.task = asyncio.create_task(self.engine.detect_intent(text, self.session))
+        self.stats['started'] += 1
+    
+    async def resolve(self, text: str) -> Dict:
+        task, matched = self.task, self.text == normalize_utterance(text)
+        self.task, self.text = None, None
+        if task is not None and matched:
+            try:
+                intent = await task
+                self.stats['hits'] += 1
+                return intent
+            except Exception as e:
+                print(f"Speculative intent detection failed: {e}")
+        elif task is not None:
+            task.cancel()
+        self.stats['misses'] += 1
+        return await self.engine.detect_intent(text, self.session)
+    
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.task, self.text = None, None
+
 class VoiceCommandEngine:
     def __init__(self):
-        self.context_window: List[Dict] = []
-        self.max_context = config.CONTEXT_WINDOW_SIZE
+        self.classifier = IntentClassifier()
+        self.transcription = create_transcription_backend()
+    
+    async def open_session(self, user_id: str) -> VoiceSession:
+        redis = get_redis() if config.VOICE_CONTEXT_BACKEND == 'redis' else None
+        session = VoiceSession(user_id, redis)
+        await session.load()
+        return session
         
     async def process_audio_stream(self, websocket: WebSocket, user_id: str):
-        transcriber = aai.RealtimeTranscriber(
-            sample_rate=config.VOICE_SAMPLE_RATE,
-            on_data=lambda transcript: asyncio.create_task(
-                self.handle_transcript(transcript, websocket, user_id)
+        loop = asyncio.get_running_loop()
+        session = await self.open_session(user_id)
+        speculator = IntentSpeculator(self, session)
+        handlers: Set[concurrent.futures.Future] = set()
+        
+        def on_data(transcript: Transcript):
+            # Called on the transcriber's thread; hand the work to the event loop
+            future = asyncio.run_coroutine_threadsafe(
+                self.handle_transcript(transcript, websocket, session, speculator), loop
             )
-        )
+            handlers.add(future)
+            future.add_done_callback(handlers.discard)
         
-        transcriber.connect()
+        transcriber = self.transcription.realtime(config.VOICE_SAMPLE_RATE, on_data)
+        await asyncio.to_thread(transcriber.connect)
+        
+        buffer = AudioRingBuffer()
+        feeder = asyncio.create_task(self._feed_transcriber(transcriber, buffer))
         
         try:
-            while True:
-                audio_data = await websocket.receive_bytes()
-                transcriber.stream(audio_data)
+            while not feeder.done():
+                await buffer.write(await websocket.receive_bytes())
         except WebSocketDisconnect:
-            transcriber.close()
+            pass
+        except RuntimeError:
+            # The feeder died and closed the buffer under a blocked write; its error is reported below
+            pass
+        finally:
+            buffer.close()
+            try:
+                await feeder
+            except Exception as e:
+                print(f"Feeding audio to the transcriber failed: {e}")
+            speculator.cancel()
+            for future in list(handlers):
+                future.cancel()
+            await asyncio.to_thread(transcriber.close)
+    
+    async def _feed_transcriber(self, transcriber, buffer: AudioRingBuffer):
+        # One feeder per stream keeps frames in order; the blocking send runs off the loop
+        try:
+            while True:
+                frame = await buffer.read()
+                if frame is None:
+                    return
+                await asyncio.to_thread(transcriber.stream, frame)
+        finally:
+            # Wakes a writer waiting on a full ring, which would otherwise never be drained
+            buffer.close()
+    
+    async def transcribe_audio(self, audio: bytes) -> Dict:
+        return await self.transcription.transcribe(audio)
     
-    async def handle_transcript(self, transcript: aai.RealtimeTranscript, websocket: WebSocket, user_id: str):
+    async def handle_transcript(self, transcript: Transcript, websocket: WebSocket,
+                                session: VoiceSession, speculator: IntentSpeculator = None):
+        user_id = session.user_id
         if not transcript.text or transcript.text.strip() == "":
             return
+        
+        if not transcript.final:
+            # Partial: only guess the intent; everything else waits for the final words
+            if speculator is not None:
+                speculator.speculate(transcript.text)
+            return
             
         # Add to context window
         context_entry = {
@@ -60,36 +165,57 @@ class VoiceCommandEngine:
             'user_id': user_id
         }
         
-        self.context_window.append(context_entry)
-        if len(self.context_window) > self.max_context:
-            self.context_window.pop(0)
+        encoded_entry = session.add(context_entry)
         
-        # Detect intent using Claude
-        intent = await self.detect_intent(transcript.text, user_id)
+        # Detect intent using Claude, usually already started from a partial transcript
+        if speculator is not None:
+            intent = await speculator.resolve(transcript.text)
+        else:
+            intent = await self.detect_intent(transcript.text, session)
         
-        # Execute command
-        result = await self.execute_command(intent, transcript.text, user_id)
+        # Learn from final words only; speculative partials may never have been said in full
+        if intent.get('source') != 'local':
+            self.classifier.add_example(transcript.text, intent.get('intent'))
         
-        # Store in Firebase
-        await self.store_interaction(user_id, transcript.text, intent, result)
+        utterance_id = uuid.uuid4().hex
+        await websocket.send_json({
+            'type': 'voice_intent',
+            'utterance_id': utterance_id,
+            'transcript': transcript.text,
+            'intent': intent
+        })
+        
+        async def send_delta(delta: str):
+            await websocket.send_json({'type': 'voice_code_delta', 'utterance_id': utterance_id, 'delta': delta})
+        
+        # Execute command, streaming generated code as it arrives
+        result = await self.execute_command(intent, transcript.text, user_id, on_delta=send_delta)
         
         # Send result back
         await websocket.send_json({
             'type': 'voice_result',
+            'utterance_id': utterance_id,
             'transcript': transcript.text,
             'intent': intent,
             'result': result,
             'timestamp': datetime.now().isoformat()
         })
+        
+        # Store in Firebase
+        await self.store_interaction(user_id, transcript.text, intent, result, session.session_id)
+        await session.spill(encoded_entry)
     
-    async def detect_intent(self, text: str, user_id: str) -> Dict:
-        context_str = json.dumps(self.context_window[-3:])
+    async def detect_intent(self, text: str, session: VoiceSession) -> Dict:
+        # Recognizable commands resolve in-process; only ambiguous ones cost an LLM call
+        local = self.classifier.classify(text)
+        if local is not None:
+            return local
         
         prompt = f"""
         Analyze this voice command for coding intent:
         
         Command: "{text}"
-        Recent context: {context_str}
+        Recent context: {session.context_fragment}
         
         Return JSON only:
         {{
@@ -108,13 +234,16 @@ class VoiceCommandEngine:
         )
         
         try:
-            return json.loads(response.content[0].text)
+            intent = json.loads(response.content[0].text)
         except:
             return {"intent": "unknown", "confidence": 0.0}
+        
+        return intent
     
-    async def execute_command(self, intent: Dict, raw_text: str, user_id: str) -> Dict:
+    async def execute_command(self, intent: Dict, raw_text: str, user_id: str,
+                              on_delta: Callable[[str], Awaitable] = None) -> Dict:
         if intent['intent'] == 'create':
-            return await self.create_code(intent, raw_text, user_id)
+            return await self.create_code(intent, raw_text, user_id, on_delta)
         elif intent['intent'] == 'modify':
             return await self.modify_code(intent, raw_text, user_id)
         elif intent['intent'] == 'debug':
@@ -124,7 +253,8 @@ class VoiceCommandEngine:
         else:
             return {"action": "unknown", "message": "Command not recognized"}
     
-    async def create_code(self, intent: Dict, raw_text: str, user_id: str) -> Dict:
+    async def create_code(self, intent: Dict, raw_text: str, user_id: str,
+                          on_delta: Callable[[str], Awaitable] = None) -> Dict:
         prompt = f"""
         Generate Python code for: {raw_text}
         
@@ -134,13 +264,18 @@ class VoiceCommandEngine:
         Return only the code, no explanations.
         """
         
-        response = await anthropic.messages.create(
+        chunks = []
+        async with anthropic.messages.stream(
             model="claude-3-sonnet-20240229",
             max_tokens=2000,
             messages=[{"role": "user", "content": prompt}]
-        )
+        ) as stream:
+            async for text in stream.text_stream:
+                chunks.append(text)
+                if on_delta is not None:
+                    await on_delta(text)
         
-        generated_code = response.content[0].text
+        generated_code = ''.join(chunks)
         
         return {
             'action': 'created',
@@ -158,19 +293,29 @@ class VoiceCommandEngine:
     async def run_tests(self, intent: Dict, raw_text: str, user_id: str) -> Dict:
         return {'action': 'tested', 'test_results': []}
     
-    async def store_interaction(self, user_id: str, command: str, intent: Dict, result: Dict):
-        doc_ref = db.collection('voice_interactions').document()
-        doc_ref.set({
+    async def store_interaction(self, user_id: str, command: str, intent: Dict, result: Dict, session_id: str = None):
+        await firestore_writer.set(db.collection('voice_interactions').document(), {
             'user_id': user_id,
             'command': command,
             'intent': intent,
             'result': result,
             'timestamp': firestore.SERVER_TIMESTAMP,
-            'session_id': str(uuid.uuid4())
+            'session_id': session_id or str(uuid.uuid4())
         })
 
 voice_engine = VoiceCommandEngine()
 
+@app.on_event("startup")
+async def train_intent_classifier():
+    if db is not None:
+        await voice_engine.classifier.train_from_firestore(db)
+
+@app.on_event("shutdown")
+async def flush_pending_writes():
+    await firestore_writer.close()
+    await close_redis()
+    voice_engine.transcription.close()
+
 @app.websocket("/voice/{user_id}")
 async def voice_websocket(websocket: WebSocket, user_id: str):
     await websocket.accept()
@@ -0,0 +1,62 @@
+import json
+import uuid
+from collections import deque
+from typing import Deque, Dict
+
+from config import config
+
+
+class VoiceSession:
+    """
+    Context for one voice connection: the last CONTEXT_WINDOW_SIZE utterances in
+    a bounded deque, and the JSON fragment detect_intent puts in its prompt. Each
+    entry is encoded once when added, so building the fragment only joins the
+    last VOICE_PROMPT_CONTEXT strings instead of re-serializing the window on
+    every utterance. With a Redis client the window is also kept in
+    `voice_context:<user_id>`, so a user reconnecting to another worker picks up
+    where they left off.
+    """
+
+    def __init__(self, user_id: str, redis=None):
+        self.user_id = user_id
+        self.session_id = uuid.uuid4().hex
+        self.redis = redis
+        self.entries: Deque[Dict] = deque(maxlen=config.CONTEXT_WINDOW_SIZE)
+        self._encoded: Deque[str] = deque(maxlen=config.VOICE_PROMPT_CONTEXT)
+        self.context_fragment = '[]'
+
+    @property
+    def key(self) -> str:
+        return f"voice_context:{self.user_id}"
+
+    def add(self, entry: Dict) -> str:
+        encoded = json.dumps(entry)
+        self.entries.append(entry)
+        self._encoded.append(encoded)
+        self.context_fragment = f"[{', '.join(self._encoded)}]"
+        return encoded
+
+    async def load(self):
+        if self.redis is None:
+            return
+        try:
+            stored = await self.redis.lrange(self.key, -config.CONTEXT_WINDOW_SIZE, -1)
+        except Exception as e:
+            print(f"Loading voice context for {self.user_id} failed: {e}")
+            return
+        for encoded in stored:
+            self.entries.append(json.loads(encoded))
+            self._encoded.append(encoded)
+        self.context_fragment = f"[{', '.join(self._encoded)}]"
+
+    async def spill(self, encoded: str):
+        if self.redis is None:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.rpush(self.key, encoded)
+                pipe.ltrim(self.key, -config.CONTEXT_WINDOW_SIZE, -1)
+                pipe.expire(self.key, config.VOICE_CONTEXT_TTL)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Saving voice context for {self.user_id} failed: {e}")
@@ -0,0 +1,103 @@
+import json
+from typing import Dict, Tuple, Union
+
+from fastapi import WebSocket
+
+try:
+    import msgpack
+except ImportError:  # binary mode is simply not offered without it
+    msgpack = None
+
+MSGPACK_SUBPROTOCOL = "nexus.msgpack.v1"
+
+# Message types travel as small integers in binary frames
+TYPE_TAGS = {
+    'cursor_move': 1,
+    'canvas_update': 2,
+    'code_change': 3,
+    'batch': 4,
+    'doc_snapshot': 5,
+    'code_change_rejected': 6,
+    'voice_command': 7
+}
+TAG_TYPES = {tag: name for name, tag in TYPE_TAGS.items()}
+
+Frame = Union[str, bytes]
+
+
+class JsonCodec:
+    name = 'json'
+    binary = False
+
+    def encode(self, message: Dict) -> str:
+        return json.dumps(message)
+
+    def decode(self, data: Frame) -> Dict:
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    """
+    MessagePack frames where 'type' is replaced by an integer tag 't' (inside
+    batches too). Clients may send cursor moves as dx/dy relative to their last
+    position; those are resolved to absolute x/y on the way in, so peers and the
+    rest of the server only see absolute coordinates. That state is per
+    connection, so each socket gets its own codec instance.
+    """
+
+    name = 'msgpack'
+    binary = True
+
+    def __init__(self):
+        self.cursor = (0, 0)
+
+    def encode(self, message: Dict) -> bytes:
+        return msgpack.packb(_tag(message), use_bin_type=True)
+
+    def decode(self, data: Frame) -> Dict:
+        if isinstance(data, str):
+            # Text frames stay valid JSON on a binary connection
+            message = json.loads(data)
+        else:
+            message = _untag(msgpack.unpackb(data, raw=False))
+
+        if message.get('type') == 'cursor_move':
+            position = message['position'] if isinstance(message.get('position'), dict) else message
+            if 'dx' in position or 'dy' in position:
+                position['x'] = self.cursor[0] + position.pop('dx', 0)
+                position['y'] = self.cursor[1] + position.pop('dy', 0)
+            if 'x' in position and 'y' in position:
+                self.cursor = (position['x'], position['y'])
+        return message
+
+
+def _tag(message: Dict) -> Dict:
+    tagged = {k: v for k, v in message.items() if k != 'type'}
+    tagged['t'] = TYPE_TAGS.get(message.get('type'), message.get('type'))
+    if 'messages' in message:
+        tagged['messages'] = [_tag(m) for m in message['messages']]
+    return tagged
+
+
+def _untag(message: Dict) -> Dict:
+    if 't' not in message:
+        return message
+    untagged = {k: v for k, v in message.items() if k != 't'}
+    untagged['type'] = TAG_TYPES.get(message['t'], message['t'])
+    if 'messages' in untagged:
+        untagged['messages'] = [_untag(m) for m in untagged['messages']]
+    return untagged
+
+
+def negotiate(websocket: WebSocket) -> Tuple[Union[JsonCodec, MsgpackCodec], str]:
+    """
+    Binary mode is chosen with the nexus.msgpack.v1 subprotocol or ?protocol=msgpack.
+    Returns the codec and the subprotocol to accept (None for plain JSON).
+    """
+    if msgpack is None:
+        return JsonCodec(), None
+    if MSGPACK_SUBPROTOCOL in websocket.scope.get('subprotocols', []):
+        return MsgpackCodec(), MSGPACK_SUBPROTOCOL
+    if websocket.query_params.get('protocol') == 'msgpack':
+        return MsgpackCodec(), None
+    return JsonCodec(), None
@@ -208,8 +208,9 @@ class APIClient {
       this.ws.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data);
-          const sanitizedData = sanitizeObject(data);
-          onMessage(sanitizedData);
+          // Cursor and canvas updates arrive coalesced into one batch frame per server tick
+          const messages = data.type === 'batch' ? data.messages : [data];
+          messages.forEach((message: any) => onMessage(sanitizeObject(message)));
         } catch (error) {
           console.error('WebSocket message parsing error:', error);
         }